@@ -0,0 +1,64 @@
+import queue
+import threading
+from datetime import datetime
+
+ACTIVITY_FILE = "/home/pi/interactive-lights/activity.txt"
+FLUSH_INTERVAL_SECS = 5
+MAX_QUEUED_ENTRIES = 1000
+
+
+class ActivityLog:
+	# appends "timestamp controller state" lines to the activity file from a background thread
+	# entries are timestamped when they happen and queued, then written out in one batch every flush interval and at shutdown
+	# the queue is bounded and never blocks, so a slow SD card costs dropped entries rather than stalling input or rendering
+	def __init__(self, logger, path=ACTIVITY_FILE, flush_interval_secs=FLUSH_INTERVAL_SECS, max_queued_entries=MAX_QUEUED_ENTRIES):
+		self.logger = logger
+		self.path = path
+		self.flush_interval_secs = flush_interval_secs
+		self.entries = queue.Queue(maxsize=max_queued_entries)
+
+		self.entries_written = 0
+		self.entries_dropped = 0
+
+		self.stop_event = threading.Event()
+		self.thread = threading.Thread(target=self.run, name='activity_log', daemon=True)
+
+	def start(self):
+		self.thread.start()
+
+	def write(self, controller_name, state):
+		now = datetime.now().strftime('%Y-%m-%dT%H:%M:%S')
+		try:
+			self.entries.put_nowait(f"{now} {controller_name} {state}\n")
+		except queue.Full:
+			self.entries_dropped += 1
+
+	def run(self):
+		while not self.stop_event.wait(self.flush_interval_secs):
+			self.flush()
+
+	def flush(self):
+		lines = []
+		while True:
+			try:
+				lines.append(self.entries.get_nowait())
+			except queue.Empty:
+				break
+		if not lines:
+			return
+
+		try:
+			with open(self.path, 'a') as f:
+				f.write(''.join(lines))
+			self.entries_written += len(lines)
+		except Exception:
+			self.logger.error(f'Encountered error writing {len(lines)} entries to activity log file', exc_info=True)
+
+	def stop(self):
+		# write out whatever is still queued once the background thread has finished its last batch
+		self.stop_event.set()
+		if self.thread.is_alive():
+			self.thread.join(timeout=2)
+		self.flush()
+		if self.entries_dropped:
+			self.logger.info(f'Activity log dropped {self.entries_dropped} entries because the queue was full')
@@ -0,0 +1,229 @@
+import argparse
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+
+from ActivityLog import ACTIVITY_FILE
+
+# streaming usage analytics over the activity file written by ActivityLog
+# the file is read incrementally from the byte offset remembered in a small json index next to it, so each run only
+# parses the lines added since the last one. active/inactive and mode_N_active entries are paired into sessions and
+# folded into per night, per controller and per mode totals, which is all the reports need
+# usage: python ActivityStats.py [activity.txt] [--index activity.txt.index.json] [--report nights|controllers|modes] [--since 2021-12-01]
+
+INDEX_VERSION = 1
+NIGHT_ROLLOVER_HOUR = 6  # entries before 6am count towards the previous night
+SYSTEM_NAME = 'SYSTEM'
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+
+class ActivityIndex:
+	# aggregates layout: nights[night][controller] = {'sessions': n, 'active_secs': s, 'modes': {mode: secs}}
+	# open_sessions holds the controllers that were active at the end of the last update so sessions can span runs
+	def __init__(self):
+		self.offset = 0
+		self.file_id = None
+		self.open_sessions = {}  # controller name -> {'active_since': epoch secs, 'mode': mode, 'mode_since': epoch secs}
+		self.current_modes = {}  # controller name -> last mode seen, modes are reset to 0 whenever a controller goes inactive
+		self.nights = {}
+		self.unclosed_sessions = 0
+		self.bad_lines = 0
+
+	@classmethod
+	def load(cls, path):
+		index = cls()
+		if not os.path.exists(path):
+			return index
+		with open(path) as f:
+			data = json.load(f)
+		if data.get('version') != INDEX_VERSION:
+			return index
+		index.offset = data['offset']
+		index.file_id = data['file_id']
+		index.open_sessions = data['open_sessions']
+		index.current_modes = data['current_modes']
+		index.nights = data['nights']
+		index.unclosed_sessions = data['unclosed_sessions']
+		index.bad_lines = data['bad_lines']
+		return index
+
+	def save(self, path):
+		data = {
+			'version': INDEX_VERSION,
+			'offset': self.offset,
+			'file_id': self.file_id,
+			'open_sessions': self.open_sessions,
+			'current_modes': self.current_modes,
+			'nights': self.nights,
+			'unclosed_sessions': self.unclosed_sessions,
+			'bad_lines': self.bad_lines,
+		}
+		temp_path = path + '.tmp'
+		with open(temp_path, 'w') as f:
+			json.dump(data, f, separators=(',', ':'))
+		os.replace(temp_path, path)
+
+	def update(self, activity_path):
+		# parse everything appended since the last update, starting over if the file was replaced or truncated
+		stat = os.stat(activity_path)
+		file_id = [stat.st_dev, stat.st_ino]
+		if file_id != self.file_id or stat.st_size < self.offset:
+			self.__init__()
+			self.file_id = file_id
+
+		with open(activity_path, 'rb') as f:
+			f.seek(self.offset)
+			data = f.read()
+
+		# leave a partly written last line for the next update
+		end = data.rfind(b'\n') + 1
+		lines = data[:end].decode('utf-8', errors='replace').splitlines()
+		for line in lines:
+			self.process_line(line)
+		self.offset += end
+		return len(lines)
+
+	def process_line(self, line):
+		parts = line.split()
+		if len(parts) != 3:
+			self.bad_lines += 1
+			return
+		try:
+			timestamp = datetime.strptime(parts[0], TIMESTAMP_FORMAT).timestamp()
+		except ValueError:
+			self.bad_lines += 1
+			return
+		name, state = parts[1], parts[2]
+
+		if name == SYSTEM_NAME:
+			if state == 'active':
+				# a start without a matching stop means the last run crashed, so its open sessions have no end time
+				self.unclosed_sessions += len(self.open_sessions)
+				self.open_sessions = {}
+				self.current_modes = {}
+				self.start_session(name, timestamp)
+			elif state == 'inactive':
+				# shutting down ends every session, the system one last
+				for open_name in [x for x in self.open_sessions if x != SYSTEM_NAME]:
+					self.end_session(open_name, timestamp)
+				self.end_session(name, timestamp)
+		elif state == 'active':
+			self.start_session(name, timestamp)
+		elif state == 'inactive':
+			self.end_session(name, timestamp)
+			self.current_modes[name] = '0'
+		elif state.startswith('mode_') and state.endswith('_active'):
+			mode = state[len('mode_'):-len('_active')]
+			session = self.open_sessions.get(name)
+			if session is not None:
+				self.add_mode_secs(name, session, timestamp)
+				session['mode'] = mode
+				session['mode_since'] = timestamp
+			self.current_modes[name] = mode
+		else:
+			self.bad_lines += 1
+
+	def start_session(self, name, timestamp):
+		if name in self.open_sessions:
+			return
+		self.open_sessions[name] = {'active_since': timestamp, 'mode': self.current_modes.get(name, '0'), 'mode_since': timestamp}
+
+	def end_session(self, name, timestamp):
+		session = self.open_sessions.pop(name, None)
+		if session is None:
+			return
+		self.add_mode_secs(name, session, timestamp)
+		totals = self.get_totals(name, session['active_since'])
+		totals['sessions'] += 1
+		totals['active_secs'] += max(0, timestamp - session['active_since'])
+
+	def add_mode_secs(self, name, session, timestamp):
+		if name == SYSTEM_NAME:
+			return
+		modes = self.get_totals(name, session['active_since'])['modes']
+		mode = str(session['mode'])
+		modes[mode] = modes.get(mode, 0) + max(0, timestamp - session['mode_since'])
+
+	def get_totals(self, name, session_start):
+		# sessions count towards the night they started in
+		night = get_night(session_start)
+		controllers = self.nights.setdefault(night, {})
+		return controllers.setdefault(name, {'sessions': 0, 'active_secs': 0, 'modes': {}})
+
+	def get_nights(self, since=None):
+		return {night: controllers for night, controllers in sorted(self.nights.items()) if since is None or night >= since}
+
+
+def get_night(timestamp):
+	return (datetime.fromtimestamp(timestamp) - timedelta(hours=NIGHT_ROLLOVER_HOUR)).strftime('%Y-%m-%d')
+
+
+def format_hours(secs):
+	return f'{secs / 3600:.2f}'
+
+
+def report_nights(nights):
+	print(f'{"night":<12}{"display h":>10}  controllers (sessions, hours)')
+	for night, controllers in nights.items():
+		display_secs = controllers.get(SYSTEM_NAME, {}).get('active_secs', 0)
+		used = ', '.join(f'{name} ({x["sessions"]}, {format_hours(x["active_secs"])})' for name, x in sorted(controllers.items()) if name != SYSTEM_NAME)
+		print(f'{night:<12}{format_hours(display_secs):>10}  {used}')
+
+
+def report_controllers(nights):
+	totals = {}
+	for controllers in nights.values():
+		for name, x in controllers.items():
+			total = totals.setdefault(name, {'sessions': 0, 'active_secs': 0, 'nights': 0})
+			total['sessions'] += x['sessions']
+			total['active_secs'] += x['active_secs']
+			total['nights'] += 1
+
+	print(f'{"controller":<12}{"nights":>8}{"sessions":>10}{"hours":>10}{"avg min":>10}')
+	for name, x in sorted(totals.items()):
+		avg_mins = x['active_secs'] / x['sessions'] / 60 if x['sessions'] else 0
+		print(f'{name:<12}{x["nights"]:>8}{x["sessions"]:>10}{format_hours(x["active_secs"]):>10}{avg_mins:>10.1f}')
+
+
+def report_modes(nights):
+	totals = {}
+	for controllers in nights.values():
+		for name, x in controllers.items():
+			for mode, secs in x['modes'].items():
+				totals.setdefault(name, {}).setdefault(mode, 0)
+				totals[name][mode] += secs
+
+	print(f'{"controller":<12}{"mode":>6}{"hours":>10}{"share":>8}')
+	for name, modes in sorted(totals.items()):
+		controller_secs = sum(modes.values()) or 1
+		for mode, secs in sorted(modes.items(), key=lambda x: (not x[0].isdigit(), int(x[0]) if x[0].isdigit() else 0, x[0])):
+			print(f'{name:<12}{mode:>6}{format_hours(secs):>10}{100 * secs / controller_secs:>7.0f}%')
+
+
+REPORTS = {
+	'nights': report_nights,
+	'controllers': report_controllers,
+	'modes': report_modes,
+}
+
+
+def main(argv):
+	parser = argparse.ArgumentParser(description='Report how long each controller and mode has been in use from the activity file')
+	parser.add_argument('activity_file', nargs='?', default=ACTIVITY_FILE)
+	parser.add_argument('--index', default=None, help='index file, defaults to the activity file name plus .index.json')
+	parser.add_argument('--report', choices=sorted(REPORTS), default='controllers')
+	parser.add_argument('--since', default=None, help='only include nights from this date on (YYYY-MM-DD)')
+	args = parser.parse_args(argv)
+
+	index_path = args.index or args.activity_file + '.index.json'
+	index = ActivityIndex.load(index_path)
+	num_lines = index.update(args.activity_file)
+	index.save(index_path)
+
+	print(f'Read {num_lines} new entries, index covers {len(index.nights)} nights ({index.bad_lines} unreadable lines, {index.unclosed_sessions} sessions cut off by a crash, {len(index.open_sessions)} still open)')
+	REPORTS[args.report](index.get_nights(args.since))
+
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
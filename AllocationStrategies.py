@@ -0,0 +1,128 @@
+import itertools
+
+AXES = 'LHD'
+DEFAULT_STRATEGIES = ['L', 'H', 'D', 'LH', 'LD', 'HD']
+SHORTFALL_COST = 1000000  # cost of a region missing a controller's whole minimum along one axis, so minimums come first
+IMBALANCE_COST_PER_PIXEL = 1  # cost of every pixel a region is off from an equal share of the display
+REGENERATION_COST_WEIGHT = 0.1  # regeneration only tips the balance between similar layouts, it shouldn't buy a smaller region
+
+
+def split_range(size, num_parts):
+	# (start, end) cutoff points of num_parts near equal parts, the first parts get the remainder
+	part_size = int(size / num_parts)
+	part_sizes = [part_size] * num_parts
+	for i in range(size - sum(part_sizes)):
+		part_sizes[i] += 1
+
+	ranges = []
+	start = 0
+	for part_size in part_sizes:
+		ranges.append((start, start + part_size - 1))
+		start += part_size
+	return ranges
+
+
+def make_region(light_dimensions, **axis_ranges):
+	# pixel allocation as a tuple of L, H, D ranges, covering the whole display along any axis not given
+	return tuple(list(axis_ranges[axis]) if axis in axis_ranges else [0, size - 1] for axis, size in zip(AXES, light_dimensions))
+
+
+def split_along(axis):
+	# slabs side by side along one axis, which is how the display was always split before
+	def strategy(light_dimensions, num_regions):
+		if light_dimensions[AXES.index(axis)] < num_regions:
+			return None
+		return [make_region(light_dimensions, **{axis: x}) for x in split_range(light_dimensions[AXES.index(axis)], num_regions)]
+	return strategy
+
+
+def tile(first_axis, second_axis):
+	# 2x2 tiles, halving first_axis and then second_axis. with three regions the first one keeps a whole half
+	def strategy(light_dimensions, num_regions):
+		if num_regions not in (3, 4) or light_dimensions[AXES.index(first_axis)] < 2 or light_dimensions[AXES.index(second_axis)] < 2:
+			return None
+		regions = []
+		for i, first_range in enumerate(split_range(light_dimensions[AXES.index(first_axis)], 2)):
+			if i == 0 and num_regions == 3:
+				regions.append(make_region(light_dimensions, **{first_axis: first_range}))
+				continue
+			for second_range in split_range(light_dimensions[AXES.index(second_axis)], 2):
+				regions.append(make_region(light_dimensions, **{first_axis: first_range, second_axis: second_range}))
+		return regions
+	return strategy
+
+
+STRATEGIES = {
+	'L': split_along('L'),
+	'H': split_along('H'),
+	'D': split_along('D'),
+	'LH': tile('L', 'H'),
+	'LD': tile('L', 'D'),
+	'HD': tile('H', 'D'),
+}
+
+
+def get_region_dimensions(region):
+	return tuple(x[1] - x[0] + 1 for x in region)
+
+
+class AllocationPlanner:
+	# picks how to divide the display between the active controllers
+	# every strategy proposes a set of regions and every way of handing them to the controllers is costed on
+	# 1. how far regions fall short of the minimum dimensions each controller asks for
+	# 2. what it costs the controllers whose region changes size to regenerate their plans for it
+	# 3. how unevenly the pixels are shared out
+	# ties go to the first strategy and to handing regions out in controller order. the layout chosen for a set of
+	# active controllers (and their minimums) is cached, so going back to the same set always gives the same layout
+	def __init__(self, logger, light_dimensions, strategy_names=DEFAULT_STRATEGIES):
+		self.logger = logger
+		self.light_dimensions = tuple(light_dimensions)
+		self.strategy_names = list(strategy_names)
+		self.cache = {}
+		self.cache_hits = 0
+
+	def plan(self, controllers, current_allocations):
+		# controllers is a list of (name, controller) for the active controllers in order
+		# and current_allocations maps names to their current pixel allocation or None
+		if len(controllers) == 0:
+			return {}
+
+		minimum_dimensions = [tuple(controller.get_minimum_dimensions()) for name, controller in controllers]
+		key = tuple((name, minimum) for (name, controller), minimum in zip(controllers, minimum_dimensions))
+		allocations = self.cache.get(key)
+		if allocations is not None:
+			self.cache_hits += 1
+			return allocations
+
+		L, H, D = self.light_dimensions
+		equal_share = L * H * D / len(controllers)
+		regeneration_costs = {}
+		best = None
+		for strategy_name in self.strategy_names:
+			regions = STRATEGIES[strategy_name](self.light_dimensions, len(controllers))
+			if regions is None:
+				continue
+
+			for order in itertools.permutations(range(len(regions))):
+				cost = 0
+				for (name, controller), minimum, region_index in zip(controllers, minimum_dimensions, order):
+					dimensions = get_region_dimensions(regions[region_index])
+					cost += SHORTFALL_COST * sum(max(0, m - x) / m for m, x in zip(minimum, dimensions) if m > 0)
+
+					current_allocation = current_allocations.get(name)
+					if current_allocation is None or get_region_dimensions(current_allocation) != dimensions:
+						if (name, dimensions) not in regeneration_costs:
+							regeneration_costs[(name, dimensions)] = controller.get_regeneration_cost(dimensions)
+						cost += REGENERATION_COST_WEIGHT * regeneration_costs[(name, dimensions)]
+
+					cost += IMBALANCE_COST_PER_PIXEL * abs(dimensions[0] * dimensions[1] * dimensions[2] - equal_share)
+
+				if best is None or cost < best[0]:
+					best = cost, strategy_name, {name: regions[region_index] for (name, controller), region_index in zip(controllers, order)}
+
+		if best is None:
+			raise ValueError(f'No allocation strategy in {self.strategy_names} can fit {len(controllers)} controllers on {self.light_dimensions}')
+		cost, strategy_name, allocations = best
+		self.cache[key] = allocations
+		self.logger.info(f'Chose {strategy_name} allocation for {[name for name, controller in controllers]} at a cost of {cost:.0f}')
+		return allocations
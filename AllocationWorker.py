@@ -0,0 +1,50 @@
+import threading
+
+
+class AllocationWorker:
+	# runs pixel reallocation (and the plan regeneration it triggers in the controllers) on a thread of its own
+	# so controller callbacks and inactivity timers only have to ask for one and can carry on handling input
+	# requests that arrive while a reallocation is running are coalesced into a single follow up run
+	def __init__(self, logger, allocate_function):
+		self.logger = logger
+		self.allocate_function = allocate_function
+
+		self.allocation_count = 0
+		self.coalesced_request_count = 0
+
+		self.is_requested = False
+		self.is_stopping = False
+		self.condition = threading.Condition()
+		self.thread = threading.Thread(target=self.run, name='allocation_worker', daemon=True)
+
+	def start(self):
+		self.thread.start()
+
+	def request(self):
+		with self.condition:
+			if self.is_requested:
+				self.coalesced_request_count += 1
+			self.is_requested = True
+			self.condition.notify()
+
+	def run(self):
+		while True:
+			with self.condition:
+				while not self.is_requested and not self.is_stopping:
+					self.condition.wait()
+				if self.is_stopping:
+					return
+				self.is_requested = False
+
+			try:
+				self.allocate_function()
+			except Exception:
+				self.logger.error('Encountered exception reallocating pixels. Carrying on with the next request', exc_info=True)
+			self.allocation_count += 1
+
+	def stop(self):
+		with self.condition:
+			self.is_stopping = True
+			self.condition.notify()
+		if self.thread.is_alive() and threading.current_thread() is not self.thread:
+			self.thread.join(timeout=5)
@@ -1,17 +1,34 @@
-import threading
+from collections import deque
 from datetime import datetime, timedelta
+from time import perf_counter
+
+import numpy as np
+
+DIGITAL_AXIS_NAMES = ['hat']  # dpads and strum bars, where every change is an input of its own and is never coalesced
 
 class InvalidPacketSize(Exception):
 	pass
 	
 
+class AxisPosition:
+	# copy of an axis' name and position taken when it moved, so a queued event is handled with the position it
+	# reported rather than wherever the axis has got to by the time the render loop gets to it
+	def __init__(self, axis):
+		self.name = axis.name
+		self.x = getattr(axis, 'x', None)
+		self.y = getattr(axis, 'y', None)
+		self.value = getattr(axis, 'value', None)
+		
+
 class PacketPlan:
-	def __init__(self, packet_time_series=None, current_index=0, is_repeating=False, time_delay=1.0):
+	def __init__(self, packet_time_series=None, current_index=0, is_repeating=False, time_delay=1.0, input_time=None):
 		self.packet_time_series = packet_time_series if packet_time_series is not None else []
 		self.current_index = current_index
 		self.is_repeating = is_repeating
 		self.time_delay = time_delay
 		self.last_motion_step_time = datetime.now()
+		self.input_time = input_time  # perf_counter time of the input that created this plan, until it has been shown
+		self.packet_arrays = {}  # index -> (packet, uint8 array of it) so each packet is only converted once, even when repeating
 		
 	def get_current_packet(self):
 		try:
@@ -19,6 +36,15 @@ class PacketPlan:
 		except IndexError:
 			return []
 			
+	def get_current_array(self):
+		# the current packet as a D x H x L x RGB uint8 array that can be copied straight into a region view
+		packet = self.get_current_packet()
+		cached = self.packet_arrays.get(self.current_index)
+		if cached is None or cached[0] is not packet:
+			cached = packet, np.asarray(packet, dtype=np.uint8)
+			self.packet_arrays[self.current_index] = cached
+		return cached[1]
+			
 	def validate_packet_time_series(self, light_dimensions):
 		L, H, D = light_dimensions
 		for m, packet in enumerate(self.packet_time_series):
@@ -63,18 +89,71 @@ class BaseController:
 		self.gui = gui
 		
 		self.last_input_datetime = datetime.now() - timedelta(hours=1)  # initialize to a long time ago so controller starts as inactive
+		self.last_input_time = None  # perf_counter time the input being handled arrived, used for input to light latency
 		self.last_motion_step_time = self.last_input_datetime
 		self.is_active = False
 		
-		# start a thread to check periodically on the last input datetime and determine if the controller has gone inactive
-		self.check_for_inactivity()
+		# the controller library calls back on its own threads, which only queue a timestamped event here.
+		# the render loop handles the queue at the start of every frame and checks for inactivity every few seconds,
+		# under the same per controller lock the allocation worker takes to regenerate plans, so only one thread
+		# ever changes controller state at a time
+		self.input_events = deque()
+		self.coalesced_event_count = 0
 		
 		for button in controller.buttons:
-			button.when_pressed = self.on_button_pressed
-			button.when_released = self.on_button_released
+			button.when_pressed = self.queue_button_pressed
+			button.when_released = self.queue_button_released
 			
 		for axis in controller.axes:
-			axis.when_moved = self.on_axis_moved
+			axis.when_moved = self.queue_axis_moved
+			
+	def queue_button_pressed(self, button):
+		self.input_events.append((perf_counter(), 'pressed', button))
+		
+	def queue_button_released(self, button):
+		self.input_events.append((perf_counter(), 'released', button))
+		
+	def queue_axis_moved(self, axis):
+		self.input_events.append((perf_counter(), 'moved', AxisPosition(axis)))
+		
+	def process_input_events(self, has_region=True):
+		# the input that wakes a controller up arrives before it has a region to draw in, so until it has one
+		# its input only marks it active and stays queued to be handled once the allocation worker has given it one
+		if not has_region:
+			if self.input_events:
+				self.register_input()
+			return
+		
+		events = []
+		while self.input_events:
+			events.append(self.input_events.popleft())
+		
+		# an analog axis (wheel, pedals, whammy) only matters for where it ended up, so just its newest event is handled
+		# and it's timed from the oldest one it stands in for. digital axes like a strum bar keep every event
+		newest_axis_events = {}
+		oldest_axis_times = {}
+		for i, (event_time, kind, source) in enumerate(events):
+			if kind == 'moved' and source.name not in DIGITAL_AXIS_NAMES:
+				newest_axis_events[source.name] = i
+				oldest_axis_times.setdefault(source.name, event_time)
+		
+		for i, (event_time, kind, source) in enumerate(events):
+			if kind == 'moved' and source.name in newest_axis_events:
+				if newest_axis_events[source.name] != i:
+					self.coalesced_event_count += 1
+					continue
+				event_time = oldest_axis_times[source.name]
+			
+			self.last_input_time = event_time
+			try:
+				if kind == 'pressed':
+					self.on_button_pressed(source)
+				elif kind == 'released':
+					self.on_button_released(source)
+				else:
+					self.on_axis_moved(source)
+			except Exception:
+				self.logger.error(f'Encountered exception handling {kind} event from {source.name} on {self.name}. Carrying on with the next event', exc_info=True)
 			
 	def on_button_pressed(self, button):
 		self.register_input()
@@ -93,6 +172,22 @@ class BaseController:
 			if self.gui is not None:
 				self.gui.set_status('Active', self.name)
 			
+	def get_mode(self):
+		return None
+		
+	def uses_hard_cuts(self):
+		# discrete content such as game boards should jump straight to each new frame rather than being blended into it
+		return False
+		
+	def get_minimum_dimensions(self):
+		# smallest L, H, D region the controller's current mode still works in, used when dividing the display
+		return 1, 1, 1
+		
+	def get_regeneration_cost(self, light_dimensions):
+		# rough cost of regenerating the controller's plans for a region of this size, in pixels written
+		L, H, D = light_dimensions
+		return L * H * D
+		
 	def update_pixel_allocation(self, light_dimensions, is_left_shared=False, is_right_shared=False):
 		raise NotImplementedError
 		# self.light_dimensions = light_dimensions
@@ -107,6 +202,4 @@ class BaseController:
 				# self.current_colors = self.current_motion_colors = []
 								
 				# # tell the rest of the system that they can release our pixels
-				# self.light_sender.go_inactive(self.name)
-			
-		# t = threading.Timer(5, self.check_for_inactivity).start()
\ No newline at end of file
+				# self.light_sender.go_inactive(self.name)
\ No newline at end of file
@@ -1,13 +1,17 @@
-import threading
 import random
 from datetime import datetime, timedelta
 
-import global_vars
+import numpy as np
+
 from BaseController import BaseController, PacketPlan
 from Lights import Lights
 from ChaseGame import ChaseGame
 from SnakeGame import SnakeGame
 
+GAME_MINIMUM_DIMENSIONS = 8, 6, 1  # smallest board the games are playable on
+GAME_MINIMUM_DIMENSIONS_3D = 8, 6, 3
+GAME_RESTART_COST = 5000  # resizing the region restarts the game, which costs more than the pixels it takes to draw
+
 
 class Car(BaseController):
 	def __init__(self, controller, logger, name, light_dimensions, light_sender, gui):
@@ -36,6 +40,8 @@ class Car(BaseController):
 
 		self.main_packet_plan = PacketPlan()
 		self.temp_packet_plans = []
+		self.motion_input_time = None  # oldest pedal or wheel change that hasn't moved any lights yet
+		self.merge_buffer = np.zeros((0, 0, 0, 3), dtype=np.uint16)
 		
 		self.chase_game = None
 		self.snake_game = None
@@ -45,6 +51,7 @@ class Car(BaseController):
 	def update_pixel_allocation(self, light_dimensions, **kwargs):
 		self.light_dimensions = light_dimensions
 		L, H, D = light_dimensions
+		self.merge_buffer = np.zeros((D, H, L, 3), dtype=np.uint16)
 		if L == 0 or H == 0 or D == 0:
 			self.main_packet_plan = PacketPlan()
 			self.temp_packet_plans = []
@@ -70,9 +77,6 @@ class Car(BaseController):
 								
 				# tell the rest of the system that they can release our pixels
 				self.light_sender.go_inactive(self.name)
-		
-		if not global_vars.STOP_THREADS:
-			t = threading.Timer(5, self.check_for_inactivity).start()
 	
 	def on_button_pressed(self, button):
 		super().on_button_pressed(button)
@@ -90,7 +94,7 @@ class Car(BaseController):
 				self.chase_game.update_enemies()
 					
 				self.main_packet_plan = self.make_packet_plan()
-				self.update_lights()
+				self.update_lights(input_time=self.last_input_time)
 				
 			elif self.macro_mode == 2 and self.snake_game is not None:
 				# for snake game, change the speed (but don't recreate board)
@@ -105,14 +109,14 @@ class Car(BaseController):
 				self.current_colors = color_list
 				
 				self.main_packet_plan = self.make_packet_plan()
-				self.update_lights()
+				self.update_lights(input_time=self.last_input_time)
 			
 			# for macro_mode 1, toggle through wall densities
 			elif self.macro_mode == 1 and self.chase_game is not None:
 				self.chase_game.update_wall_density()
 				
 				self.main_packet_plan = self.make_packet_plan()
-				self.update_lights()
+				self.update_lights(input_time=self.last_input_time)
 															
 		elif color == 'down_left':
 			if self.macro_mode == 0:
@@ -121,19 +125,21 @@ class Car(BaseController):
 				self.logger.info(f'Car Select Mode = {self.select_mode}')
 				
 				self.main_packet_plan = self.make_packet_plan()
-				self.update_lights()
+				self.update_lights(input_time=self.last_input_time)
 				
 			elif self.macro_mode == 1 and self.chase_game is not None:
 				# change between 2d and 3d for chase game
 				self.chase_game.toggle_3d()
 				self.main_packet_plan = self.make_packet_plan()
-				self.update_lights()
+				self.update_lights(input_time=self.last_input_time)
+				self.request_room_for_game()
 				
 			elif self.macro_mode == 2 and self.snake_game is not None:
 				# change between 2d and 3d for snake game
 				self.snake_game.toggle_3d()
 				self.main_packet_plan = self.make_packet_plan(starting_snake_length=len(self.snake_game.snake))
-				self.update_lights()
+				self.update_lights(input_time=self.last_input_time)
+				self.request_room_for_game()
 				
 		elif color == 'down_right':
 			# toggle macro modes between light control and games
@@ -142,12 +148,15 @@ class Car(BaseController):
 			self.logger.info(f'Car Macro Mode = {self.macro_mode}')
 			self.main_packet_plan = self.make_packet_plan(include_intro_screen=True)
 			self.light_sender.write_log_entry(self.name, f"mode_{self.macro_mode}_active")
-			self.update_lights()
+			self.update_lights(input_time=self.last_input_time)
+			self.request_room_for_game()
 			
 		elif color in ['paddle_up', 'paddle_down']:
 			# mode 0: change the speed for the z axis 
 			# mode 1: move in the z axis one pixel
 			# mode 2: set direction of motion to be forward or backward
+			if self.motion_input_time is None:
+				self.motion_input_time = self.last_input_time
 			
 			if color == 'paddle_up':
 				if self.macro_mode == 0:
@@ -249,23 +258,52 @@ class Car(BaseController):
 			self.logger.info(f'{device} {value} {value2}')
 			
 		if is_changed:
+			if self.motion_input_time is None:
+				self.motion_input_time = self.last_input_time
 			self.update_lights()
 			
-	def update_lights(self):
-		# invoke light updater
-		new_packet = self.main_packet_plan.get_current_packet()
-		if self.temp_packet_plans:
-			packets_to_merge = [new_packet] + [x.get_current_packet() for x in self.temp_packet_plans]
-			try:
-				new_packet = Lights.merge_packets(packets_to_merge, self.light_dimensions)
-			except TypeError:
-				for item in self.temp_packet_plans:
-					print(len(item.packet_time_series))
-				raise
-			except IndexError:
-				self.logger.warning('Index error when merging packets, likely due to light dimensions being reallocated. Skipping merge and using main packet instead and expecting it to fix itself next time around')
+	def get_mode(self):
+		return self.macro_mode
+		
+	def uses_hard_cuts(self):
+		return self.macro_mode != 0  # the games
+		
+	def get_minimum_dimensions(self):
+		game = self.chase_game if self.macro_mode == 1 else self.snake_game if self.macro_mode == 2 else None
+		if game is None:
+			return super().get_minimum_dimensions()
+		return GAME_MINIMUM_DIMENSIONS_3D if game.is_3d else GAME_MINIMUM_DIMENSIONS
 		
-		self.light_sender.set_lights(self.name, new_packet)
+	def get_regeneration_cost(self, light_dimensions):
+		cost = super().get_regeneration_cost(light_dimensions)
+		if self.macro_mode != 0:
+			cost += GAME_RESTART_COST
+		return cost
+		
+	def request_room_for_game(self):
+		# ask for a new layout when the region is too small for the game that was just started
+		if any(x < m for x, m in zip(self.light_dimensions, self.get_minimum_dimensions())):
+			self.light_sender.request_allocation()
+		
+	def pop_motion_input_time(self):
+		input_time, self.motion_input_time = self.motion_input_time, None
+		return input_time
+			
+	def update_lights(self, input_time=None):
+		# invoke light updater, merging any temporary plans over the main one straight into our region
+		main_array = self.main_packet_plan.get_current_array()
+		with self.light_sender.region(self.name, input_time=input_time) as view:
+			if view is None or main_array.shape != view.shape:
+				return  # nothing to show yet or the plan was made for the region before a reallocation
+			
+			temp_arrays = [x.get_current_array() for x in self.temp_packet_plans]
+			if not temp_arrays:
+				np.copyto(view, main_array)
+			elif self.merge_buffer.shape == view.shape and all(x.shape == view.shape for x in temp_arrays):
+				Lights.merge_packet_arrays([main_array] + temp_arrays, view, self.merge_buffer)
+			else:
+				self.logger.warning('Packet sizes do not match the region, likely due to light dimensions being reallocated. Skipping merge and using main packet instead and expecting it to fix itself next time around')
+				np.copyto(view, main_array)
 		
 	def next_moving_step(self, current_time):
 		# determine when a sequence should be shifted
@@ -289,10 +327,7 @@ class Car(BaseController):
 				
 		indexes_to_remove.sort(reverse=True)
 		for ind in indexes_to_remove:
-			try:
-				self.temp_packet_plans.pop(ind)
-			except IndexError:
-				pass
+			self.temp_packet_plans.pop(ind)
 
 		if self.macro_mode == 0:	
 			# if direction is not None, that means some control is engaged so we want motion
@@ -332,7 +367,7 @@ class Car(BaseController):
 					packet = Lights.shift_packet(self.main_packet_plan.get_current_packet(), 1, left=left, right=right, up=up, down=down, forward=forward, backward=backward)
 					self.main_packet_plan = PacketPlan([packet])
 					self.main_packet_plan.last_motion_step_time = current_time
-					self.update_lights()
+					self.update_lights(input_time=self.pop_motion_input_time())
 		
 		elif self.macro_mode == 1 and self.chase_game is not None:
 			if self.wheel_direction is not None and (current_time - self.last_motion_step_time_wheel).total_seconds() >= self.wheel_time_delay:
@@ -366,7 +401,7 @@ class Car(BaseController):
 			if packet is not None:
 				self.main_packet_plan = PacketPlan([packet])
 				self.main_packet_plan.last_motion_step_time = current_time
-				self.update_lights()
+				self.update_lights(input_time=self.pop_motion_input_time())
 				
 		elif self.macro_mode == 2 and self.snake_game is not None:
 			# for snake game, just call out to the game and let it decide what to do since all direction input is asynchronously set
@@ -380,7 +415,7 @@ class Car(BaseController):
 				changed = True
 			
 			if changed:
-				self.update_lights()
+				self.update_lights(input_time=self.pop_motion_input_time())
 	
 	@staticmethod
 	def get_axis_details(axis):
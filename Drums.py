@@ -1,8 +1,8 @@
 import sched
-import threading
 from datetime import datetime, timedelta
 
-import global_vars
+import numpy as np
+
 from BaseController import BaseController, PacketPlan
 from Lights import Lights
 
@@ -27,9 +27,11 @@ class Drums(BaseController):
 		self.color_spread_map = {}
 		
 		self.current_packet_plans = []
+		self.merge_buffer = self.make_merge_buffer(light_dimensions)
 			
 	def update_pixel_allocation(self, light_dimensions, **kwargs):
 		self.light_dimensions = L, H, D = light_dimensions
+		self.merge_buffer = self.make_merge_buffer(light_dimensions)
 		self.create_allocation_and_masks(mode=self.mode)
 		self.create_spread_starting_point()
 	
@@ -132,9 +134,6 @@ class Drums(BaseController):
 								
 				# tell the rest of the system that they can release our pixels
 				self.light_sender.go_inactive(self.name)
-		
-		if not global_vars.STOP_THREADS:
-			t = threading.Timer(5, self.check_for_inactivity).start()
 	
 	def on_button_pressed(self, button):
 		super().on_button_pressed(button)
@@ -155,7 +154,7 @@ class Drums(BaseController):
 							pulse_size=self.color_spread_map[color]["pulse"],
 							frames=8
 						)
-						self.current_packet_plans.append(PacketPlan(packet_time_series, time_delay=self.time_delay))
+						self.current_packet_plans.append(PacketPlan(packet_time_series, time_delay=self.time_delay, input_time=self.last_input_time))
 				except KeyError:
 					self.logger.error('Error finding color starting point for mode 0. Skipping for now and will try again next time')
 				
@@ -168,7 +167,9 @@ class Drums(BaseController):
 				)
 				packet_time_series = Lights.apply_dim_time_series(packet_time_series, [self.color_masks[color]]*len(packet_time_series))
 			
-				self.current_packet_plans.append(PacketPlan(packet_time_series, time_delay=self.time_delay))
+				self.current_packet_plans.append(PacketPlan(packet_time_series, time_delay=self.time_delay, input_time=self.last_input_time))
+			
+			self.update_lights()
 				
 		elif color == 'plus':
 			self.mode = 0 if self.mode == 4 else self.mode + 1
@@ -180,21 +181,43 @@ class Drums(BaseController):
 			self.light_sender.write_log_entry(self.name, f"mode_{self.mode}_active")
 			self.create_allocation_and_masks(mode=self.mode)
 	
+	def get_mode(self):
+		return self.mode
+		
+	def get_minimum_dimensions(self):
+		# each drum needs at least a pixel of its own in the box, vertical, horizontal and depthal modes
+		return {1: (4, 4, 1), 2: (5, 1, 1), 3: (1, 5, 1), 4: (1, 1, 5)}.get(self.mode, (1, 1, 1))
+		
+	def get_regeneration_cost(self, light_dimensions):
+		# a full size mask is built for every drum
+		L, H, D = light_dimensions
+		return L * H * D * len(self.color_masks)
+	
+	@staticmethod
+	def make_merge_buffer(light_dimensions):
+		L, H, D = light_dimensions
+		return np.zeros((D, H, L, 3), dtype=np.uint16)
+	
 	def update_lights(self):
-		# grab the current index for all active plans and merge those plans together
+		# grab the current index for all active plans and merge those plans together straight into our region
 		# if there are no active plans left, then set to black
+		input_time = None
 		if self.current_packet_plans:
-			packets_to_merge = [x.get_current_packet() for x in self.current_packet_plans]
-			try:
-				packet = Lights.merge_packets(packets_to_merge, self.light_dimensions)
-			except IndexError:
-				self.logger.warning('Index error when merging packets, likely due to light dimensions being reallocated. Setting to black for now and expecting it to fix itself next time around')
-				packet = Lights.make_whole_string_packet((0, 0, 0), self.light_dimensions)
-		else:
-			packet = Lights.make_whole_string_packet((0, 0, 0), self.light_dimensions)
-			
-		# invoke light updater
-		self.light_sender.set_lights(self.name, packet)
+			# carry the oldest hit that hasn't been shown yet through to the light sender for latency tracking
+			input_times = [x.input_time for x in self.current_packet_plans if x.input_time is not None]
+			if input_times:
+				input_time = min(input_times)
+				for x in self.current_packet_plans:
+					x.input_time = None
+
+		packet_arrays = [x.get_current_array() for x in self.current_packet_plans]
+		with self.light_sender.region(self.name, input_time=input_time) as view:
+			if view is not None:
+				if self.merge_buffer.shape == view.shape and all(x.shape == view.shape for x in packet_arrays):
+					Lights.merge_packet_arrays(packet_arrays, view, self.merge_buffer)
+				else:
+					self.logger.warning('Packet sizes do not match the region, likely due to light dimensions being reallocated. Setting to black for now and expecting it to fix itself next time around')
+					view.fill(0)
 		
 	def next_moving_step(self, current_time):
 		is_any_advanced = False
@@ -208,10 +231,7 @@ class Drums(BaseController):
 				
 		indexes_to_remove.sort(reverse=True)
 		for ind in indexes_to_remove:
-			try:
-				self.current_packet_plans.pop(ind)
-			except IndexError:
-				pass
+			self.current_packet_plans.pop(ind)
 
 		if is_any_advanced:
 			# invoke light updater
@@ -250,6 +270,7 @@ class Drums(BaseController):
 	@staticmethod
 	def get_axis_details(axis):
 		hat_mapping = {
+			(0, 0): "center",
 			(0, 1): "up",
 			(1, 1): "right_up",
 			(1, 0): "right",
@@ -0,0 +1,96 @@
+import mmap
+import struct
+
+import numpy as np
+
+MAGIC = b'ICFRAMES'
+FORMAT_VERSION = 1
+HEADER_FORMAT = '<8sIIIIQQd'  # magic, version, header size, num universes, frame size, capacity, frame count, created time
+UNIVERSE_FORMAT = '<III'  # universe number, channel offset within the frame, number of channels
+FRAME_COUNT_OFFSET = struct.calcsize('<8sIIIIQ')
+RECORDING_HOURS = 22.25 - 16  # 4pm to 10:15pm
+
+
+def get_capacity_frames(fps, hours=RECORDING_HOURS):
+	return int(hours * 60 * 60 * fps)
+
+
+DEFAULT_CAPACITY_FRAMES = get_capacity_frames(20)
+
+
+class RecordingFull(Exception):
+	pass
+
+
+class FrameRecorder:
+	# appends every flushed frame to a preallocated memory mapped file laid out as
+	# header | universe table | capacity x float64 timestamps | capacity x frame_size channel bytes
+	# appending is two copies into the map and an in place update of the frame count, with no file writes or allocations
+	def __init__(self, path, output_map, universe_numbers, capacity_frames=DEFAULT_CAPACITY_FRAMES, created_time=0.0):
+		self.path = path
+		self.capacity_frames = capacity_frames
+		self.frame_size = len(output_map.channel_buffer)
+		self.frame_count = 0
+
+		universe_table = b''.join(
+			struct.pack(UNIVERSE_FORMAT, universe_number, start, stop - start)
+			for universe_number, (start, stop) in zip(universe_numbers, output_map.universe_slices)
+		)
+		header_size = struct.calcsize(HEADER_FORMAT) + len(universe_table)
+		header_size += -header_size % 8  # keep the timestamps aligned
+		file_size = header_size + capacity_frames * (8 + self.frame_size)
+
+		self.file = open(path, 'w+b')
+		self.file.truncate(file_size)
+		self.map = mmap.mmap(self.file.fileno(), file_size)
+		struct.pack_into(HEADER_FORMAT, self.map, 0, MAGIC, FORMAT_VERSION, header_size, len(universe_numbers), self.frame_size, capacity_frames, 0, created_time)
+		self.map[struct.calcsize(HEADER_FORMAT):struct.calcsize(HEADER_FORMAT) + len(universe_table)] = universe_table
+
+		self.timestamps = np.ndarray((capacity_frames,), dtype=np.float64, buffer=self.map, offset=header_size)
+		self.frames = np.ndarray((capacity_frames, self.frame_size), dtype=np.uint8, buffer=self.map, offset=header_size + 8 * capacity_frames)
+
+	def append(self, timestamp, channel_buffer):
+		if self.frame_count >= self.capacity_frames:
+			raise RecordingFull(f'{self.path} is full after {self.frame_count} frames')
+		self.frames[self.frame_count] = channel_buffer
+		self.timestamps[self.frame_count] = timestamp
+		self.frame_count += 1
+		struct.pack_into('<Q', self.map, FRAME_COUNT_OFFSET, self.frame_count)
+
+	def close(self):
+		# drop the numpy views before closing the map they point into
+		self.timestamps = self.frames = None
+		self.map.flush()
+		self.map.close()
+		self.file.close()
+
+
+class FrameRecording:
+	# read only view of a file written by FrameRecorder
+	def __init__(self, path):
+		self.path = path
+		self.file = open(path, 'rb')
+		self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+		magic, version, header_size, num_universes, self.frame_size, self.capacity_frames, self.frame_count, self.created_time = struct.unpack_from(HEADER_FORMAT, self.map, 0)
+		if magic != MAGIC or version != FORMAT_VERSION:
+			raise ValueError(f'{path} is not a version {FORMAT_VERSION} frame recording')
+
+		self.universes = []
+		offset = struct.calcsize(HEADER_FORMAT)
+		for i in range(num_universes):
+			universe_number, start, num_channels = struct.unpack_from(UNIVERSE_FORMAT, self.map, offset)
+			self.universes.append((universe_number, start, start + num_channels))
+			offset += struct.calcsize(UNIVERSE_FORMAT)
+
+		self.timestamps = np.ndarray((self.frame_count,), dtype=np.float64, buffer=self.map, offset=header_size)
+		self.frames = np.ndarray((self.frame_count, self.frame_size), dtype=np.uint8, buffer=self.map, offset=header_size + 8 * self.capacity_frames)
+
+	def __len__(self):
+		return self.frame_count
+
+	def close(self):
+		self.timestamps = self.frames = None
+		self.map.close()
+		self.file.close()
+
@@ -0,0 +1,96 @@
+from bisect import bisect_left
+
+# bucket upper bounds in milliseconds, roughly logarithmic so one histogram covers microseconds to whole seconds
+BUCKET_BOUNDS_MS = [0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, float('inf')]
+
+
+class LatencyHistogram:
+	# fixed size histogram of durations, cheap enough to record into on every frame
+	def __init__(self, bounds_ms=BUCKET_BOUNDS_MS):
+		self.bounds_secs = [x / 1000 for x in bounds_ms]
+		self.reset()
+
+	def reset(self):
+		self.counts = [0] * len(self.bounds_secs)
+		self.count = 0
+		self.total_secs = 0.0
+		self.max_secs = 0.0
+
+	def record(self, secs):
+		self.counts[bisect_left(self.bounds_secs, secs)] += 1
+		self.count += 1
+		self.total_secs += secs
+		if secs > self.max_secs:
+			self.max_secs = secs
+
+	def percentile(self, pct):
+		# upper bound of the bucket the percentile falls in, capped at the largest value seen
+		if self.count == 0:
+			return 0.0
+		target = self.count * pct / 100
+		running = 0
+		for bound, count in zip(self.bounds_secs, self.counts):
+			running += count
+			if running >= target:
+				return min(bound, self.max_secs)
+		return self.max_secs
+
+	def summary(self):
+		if self.count == 0:
+			return 'n=0'
+		mean_ms = 1000 * self.total_secs / self.count
+		return f'n={self.count} mean={mean_ms:.2f} p50<={1000 * self.percentile(50):.2f} p99<={1000 * self.percentile(99):.2f} max={1000 * self.max_secs:.2f}ms'
+
+
+class FrameStats:
+	# per stage timing histograms for the render path plus tick jitter and overrun tracking
+	# stages: tick (whole render tick), controller_update (controller next_moving_step calls including their set_lights),
+	# compose (writing a region into the back packet), encode (gather + scale + payloads), handoff (output backend and recorder)
+	STAGES = ['tick', 'controller_update', 'compose', 'encode', 'handoff', 'jitter']
+
+	def __init__(self, logger, frame_period, log_interval_secs=60):
+		self.logger = logger
+		self.frame_period = frame_period
+		self.log_interval_secs = log_interval_secs
+		self.histograms = {x: LatencyHistogram() for x in self.STAGES}
+		self.input_latency_histograms = {}  # (controller name, mode) -> time from input arriving to its pixels being handed to the output
+		self.last_tick_start = None
+		self.last_log_time = None
+		self.last_overrun_count = 0
+		self.last_skipped_frame_count = 0
+
+	def record(self, stage, secs):
+		self.histograms[stage].record(secs)
+
+	def record_input_latency(self, controller_name, mode, secs):
+		key = controller_name, mode
+		if key not in self.input_latency_histograms:
+			self.input_latency_histograms[key] = LatencyHistogram()
+		self.input_latency_histograms[key].record(secs)
+
+	def record_tick_start(self, tick_start):
+		# jitter is how far the gap between tick starts strays from the frame period
+		if self.last_tick_start is not None:
+			self.histograms['jitter'].record(abs(tick_start - self.last_tick_start - self.frame_period))
+		self.last_tick_start = tick_start
+		if self.last_log_time is None:
+			self.last_log_time = tick_start
+
+	def maybe_log_summary(self, now, render_loop):
+		if self.last_log_time is None or now - self.last_log_time < self.log_interval_secs:
+			return
+		overruns = render_loop.overrun_count - self.last_overrun_count
+		skipped = render_loop.skipped_frame_count - self.last_skipped_frame_count
+		self.last_overrun_count = render_loop.overrun_count
+		self.last_skipped_frame_count = render_loop.skipped_frame_count
+
+		stage_summaries = ' | '.join(f'{stage} {self.histograms[stage].summary()}' for stage in self.STAGES)
+		self.logger.info(f'Frame stats over {now - self.last_log_time:.0f}s: overruns={overruns} skipped_frames={skipped} | {stage_summaries}')
+		for histogram in self.histograms.values():
+			histogram.reset()
+
+		if self.input_latency_histograms:
+			input_summaries = ' | '.join(f'{name} mode {mode} {histogram.summary()}' for (name, mode), histogram in sorted(self.input_latency_histograms.items(), key=lambda x: str(x[0])))
+			self.logger.info(f'Input to light latency: {input_summaries}')
+			self.input_latency_histograms = {}
+		self.last_log_time = now
@@ -1,7 +1,7 @@
-import threading
 from datetime import datetime, timedelta
 
-import global_vars
+import numpy as np
+
 from BaseController import BaseController, PacketPlan
 from Lights import Lights
 
@@ -22,16 +22,11 @@ class Guitar(BaseController):
 		self.current_motion_colors = []
 		self.main_packet_plan = PacketPlan([Lights.make_whole_string_packet((0, 0, 0), self.light_dimensions)])
 		
-		for button in controller.buttons:
-			button.when_pressed = self.on_button_pressed
-			button.when_released = self.on_button_released
-			
 		for axis in controller.axes:
 			if self.get_friendly_axis_name(axis.name) == 'selector':
 				# initialize selector switch
 				_, self.selector_position = self.get_axis_details(axis)
 				self.main_packet_plan.time_delay = self.get_time_delay_from_selector_position(self.selector_position)
-			axis.when_moved = self.on_axis_moved
 			
 	def update_pixel_allocation(self, light_dimensions, **kwargs):
 		self.light_dimensions = light_dimensions
@@ -50,9 +45,6 @@ class Guitar(BaseController):
 				self.light_sender.go_inactive(self.name)
 				if self.gui is not None:
 					self.gui.set_guitar_status('Inactive')
-		
-		if not global_vars.STOP_THREADS:
-			t = threading.Timer(5, self.check_for_inactivity).start()
 	
 	def on_button_pressed(self, button):
 		super().on_button_pressed(button)
@@ -78,7 +70,7 @@ class Guitar(BaseController):
 			self.select_mode = 0 if self.select_mode == 5 else self.select_mode + 1
 			self.logger.info(f'Guitar Select Mode = {self.select_mode}')
 			self.light_sender.write_log_entry(self.name, f"mode_{self.select_mode}_active")
-			self.run_lights(self.current_motion_colors, mode=self.select_mode)
+			self.run_lights(self.current_motion_colors, mode=self.select_mode, input_time=self.last_input_time)
 			
 	def on_axis_moved(self, axis):
 		super().on_axis_moved(axis)
@@ -86,7 +78,7 @@ class Guitar(BaseController):
 		
 		if device == 'dpad' and value in ['up', 'down']:
 			self.current_motion_colors = list(self.current_colors)
-			self.run_lights(self.current_colors, mode=self.select_mode)
+			self.run_lights(self.current_colors, mode=self.select_mode, input_time=self.last_input_time)
 			
 		elif device == 'dpad' and value in ['left']:
 			if self.motion_direction_index == 0:
@@ -94,7 +86,7 @@ class Guitar(BaseController):
 			else:
 				self.motion_direction_index -= 1
 			self.logger.info('Current motion direction = ' + self.motion_direction_list[self.motion_direction_index])
-			self.run_lights(self.current_motion_colors, mode=self.select_mode)
+			self.run_lights(self.current_motion_colors, mode=self.select_mode, input_time=self.last_input_time)
 		
 		elif device == 'dpad' and value in ['right']:
 			if self.motion_direction_index == len(self.motion_direction_list) - 1:
@@ -102,16 +94,14 @@ class Guitar(BaseController):
 			else:
 				self.motion_direction_index += 1
 			self.logger.info('Current motion direction = ' + self.motion_direction_list[self.motion_direction_index])
-			self.run_lights(self.current_motion_colors, mode=self.select_mode)
+			self.run_lights(self.current_motion_colors, mode=self.select_mode, input_time=self.last_input_time)
 			
 		elif device == 'whammy':
 			dimming_ratio = self.calculate_whammy_dimming(value)
 			self.dim_ratio = None if dimming_ratio == 1 else dimming_ratio
 			
-			new_packet = self.dim_packet(self.main_packet_plan.get_current_packet(), self.dim_ratio)
-						
 			# invoke light updater
-			self.light_sender.set_lights(self.name, new_packet)
+			self.show_main_packet(input_time=self.last_input_time)
 				
 		elif device == 'selector':
 			self.selector_position = value
@@ -119,7 +109,19 @@ class Guitar(BaseController):
 			self.logger.info(f'Guitar Selector Position = {value}')
 	
 	
-	def run_lights(self, color_list, mode=0):
+	def get_mode(self):
+		return self.select_mode
+		
+	def get_regeneration_cost(self, light_dimensions):
+		# the scrolling modes build a shifted packet for every step across the region, or for every color
+		L, H, D = light_dimensions
+		if self.select_mode == 2:
+			return L * H * D * L
+		elif self.select_mode == 3:
+			return L * H * D * max(1, len(self.current_motion_colors))
+		return L * H * D
+	
+	def run_lights(self, color_list, mode=0, input_time=None):
 		L, H, D = self.light_dimensions
 		num_colors = len(color_list)
 		if num_colors == 0:
@@ -165,37 +167,27 @@ class Guitar(BaseController):
 			
 		self.main_packet_plan = packet_plan
 		
-		# check whammy position and dim accordingly
-		new_packet = self.dim_packet(self.main_packet_plan.get_current_packet(), self.dim_ratio)
-			
 		# invoke light updater
-		self.light_sender.set_lights(self.name, new_packet)
+		self.show_main_packet(input_time=input_time)
 		
 	def next_moving_step(self, current_time):
 		if self.select_mode > 1:
 			is_advanced, is_ended = self.main_packet_plan.advance_packet_plan(current_time)
 		
 			if is_advanced:
-				# check whammy position and dim accordingly
-				new_packet = self.dim_packet(self.main_packet_plan.get_current_packet(), self.dim_ratio)
-									
 				# invoke light updater
-				self.light_sender.set_lights(self.name, new_packet)
+				self.show_main_packet()
+	
+	def show_main_packet(self, input_time=None):
+		# copy the current packet of the main plan straight into our region, dimmed according to the whammy position
+		packet_array = self.main_packet_plan.get_current_array()
+		with self.light_sender.region(self.name, input_time=input_time) as view:
+			if view is not None and view.shape == packet_array.shape:
+				if self.dim_ratio is None:
+					np.copyto(view, packet_array)
+				else:
+					np.multiply(packet_array, self.dim_ratio, out=view, casting='unsafe')
 
-	@staticmethod
-	def dim_packet(packet, dim_ratio):
-		if dim_ratio is not None:
-			new_packet = []
-			for grid in packet:
-				new_grid = []
-				for row in grid:
-					new_grid.append([(int(x[0] * dim_ratio), int(x[1] * dim_ratio), int(x[2] * dim_ratio)) for x in row])
-				new_packet.append(new_grid)
-		else:
-			new_packet = packet
-			
-		return new_packet
-		
 	@staticmethod
 	def calculate_whammy_dimming(whammy_value):
 		return (whammy_value + 1) / 2 * -.9 + 1 # make it fully positive and scale for 0 (untouched) to 1 (fully engaged)
@@ -233,6 +225,7 @@ class Guitar(BaseController):
 	@staticmethod
 	def get_axis_details(axis):
 		hat_mapping = {
+			(0, 0): "center",
 			(0, 1): "up",
 			(1, 1): "right_up",
 			(1, 0): "right",
@@ -23,13 +23,26 @@ class Interlude:
 			time_delay=0.25
 		)
 			
+	def process_input_events(self, has_region=True):
+		pass
+		
+	def check_for_inactivity(self):
+		pass
+	
+	def get_minimum_dimensions(self):
+		return 1, 1, 1
+		
+	def get_regeneration_cost(self, light_dimensions):
+		L, H, D = light_dimensions
+		return L * H * D * len(self.main_packet_plan.packet_time_series)
+	
 	def update_pixel_allocation(self, light_dimensions, **kwargs):
 		self.light_dimensions = light_dimensions
 		self.main_packet_plan = self.make_main_packet_plan()
-		self.light_sender.set_lights(self.name, self.main_packet_plan.get_current_packet())
+		self.light_sender.set_lights(self.name, self.main_packet_plan.get_current_array())
 	
 	def next_moving_step(self, current_time):
 		is_advanced, is_ended = self.main_packet_plan.advance_packet_plan(current_time)
 		if is_advanced:	
 			# invoke light updater
-			self.light_sender.set_lights(self.name, self.main_packet_plan.get_current_packet())
\ No newline at end of file
+			self.light_sender.set_lights(self.name, self.main_packet_plan.get_current_array())
\ No newline at end of file
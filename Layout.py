@@ -0,0 +1,252 @@
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+
+from OutputMap import OutputMap
+from PowerLimiter import MILLIAMPS_PER_CHANNEL
+
+DMX_CHANNELS_PER_UNIVERSE = 512
+CACHE_DIR_NAME = '.cache'
+COMPILER_VERSION = 1  # bump when the compiled format changes so stale caches are ignored
+
+
+class InvalidLayout(Exception):
+	pass
+
+
+class Layout:
+	# a layout file describes how the pixel strands are wired into universes, for example
+	# {
+	# 	"light_dimensions": [30, 10, 5],
+	# 	"default_destination": "192.168.0.105",
+	# 	"universes": [
+	# 		{
+	# 			"universe": 1,
+	# 			"start_channel": 1,
+	# 			"destination": "192.168.0.106",
+	# 			"strands": [
+	# 				{"grid": 0, "first_column": 0, "num_strands": 17, "pixels_per_strand": 10, "start_corner": "bottom_left", "serpentine": true}
+	# 			]
+	# 		}
+	# 	]
+	# }
+	# strands run vertically (along H). start_corner says where the first pixel of the run is:
+	# bottom/top is the end of the first strand that is wired first and left/right is the side of the run it starts on.
+	# with serpentine wiring every other strand runs the opposite direction
+	# destination is the address of the E1.31 receiver (pixel controller) the universe is sent to, falling back to default_destination
+	#
+	# instead of universes a layout can list just the strand runs in wiring order under "strands" (each optionally with a
+	# destination) plus an optional "first_universe", and they are packed into universes automatically, see pack_universes
+	def __init__(self, path, light_dimensions, universes, output_map, universe_destinations, power_groups=None, milliamps_per_channel=MILLIAMPS_PER_CHANNEL):
+		self.path = path
+		self.light_dimensions = light_dimensions
+		self.universes = universes
+		self.output_map = output_map
+		self.universe_destinations = universe_destinations
+		self.power_groups = power_groups or []  # (universe indexes, budget amps) per power injection group
+		self.milliamps_per_channel = milliamps_per_channel
+
+	@classmethod
+	def load(cls, path, logger=None):
+		with open(path, 'rb') as f:
+			raw = f.read()
+		config = json.loads(raw)
+
+		light_dimensions = tuple(config['light_dimensions'])
+		if 'universes' in config:
+			universes = config['universes']
+		else:
+			universes = cls.pack_universes(light_dimensions, config['strands'], config.get('first_universe', 1), config.get('default_destination'))
+		universe_destinations = cls.get_universe_destinations(universes, config.get('default_destination'))
+		power_groups = cls.get_power_groups(universes, config.get('power_groups', []))
+
+		# the compiled channel map is cached on disk keyed by a hash of the layout file
+		file_hash = hashlib.sha1(raw + f'v{COMPILER_VERSION}'.encode()).hexdigest()[:16]
+		cache_dir = os.path.join(os.path.dirname(os.path.abspath(path)), CACHE_DIR_NAME)
+		cache_path = os.path.join(cache_dir, f'{os.path.splitext(os.path.basename(path))[0]}.{file_hash}.npz')
+
+		output_map = None
+		if os.path.exists(cache_path):
+			try:
+				with np.load(cache_path) as cached:
+					output_map = OutputMap(light_dimensions, cached['gather_index'], cached['universe_slices'], cached['universe_channel_offsets'])
+			except Exception:
+				if logger is not None:
+					logger.warning(f'Unable to read cached layout {cache_path}. Recompiling it', exc_info=True)
+
+		if output_map is None:
+			output_map = cls.compile_output_map(light_dimensions, universes)
+			try:
+				os.makedirs(cache_dir, exist_ok=True)
+				np.savez(
+					cache_path,
+					gather_index=output_map.gather_index,
+					universe_slices=np.array(output_map.universe_slices, dtype=np.intp).reshape(-1, 2),
+					universe_channel_offsets=np.array([len(x) for x in output_map.universe_padding], dtype=np.intp)
+				)
+			except OSError:
+				if logger is not None:
+					logger.warning(f'Unable to cache compiled layout to {cache_path}', exc_info=True)
+
+		if logger is not None:
+			logger.info(f'Loaded layout {path} with light dimensions {light_dimensions} across {len(universes)} universes and {len(set(universe_destinations))} receivers')
+
+		return cls(path, light_dimensions, universes, output_map, universe_destinations, power_groups, config.get('milliamps_per_channel', MILLIAMPS_PER_CHANNEL))
+
+	@staticmethod
+	def get_universe_destinations(universes, default_destination=None):
+		destinations = []
+		for uni in universes:
+			destination = uni.get('destination', default_destination)
+			if destination is None:
+				raise InvalidLayout(f"universe {uni['universe']} has no destination and the layout has no default_destination")
+			destinations.append(destination)
+		return destinations
+
+	@staticmethod
+	def get_power_groups(universes, power_group_configs):
+		universe_indexes = {uni['universe']: i for i, uni in enumerate(universes)}
+		power_groups = []
+		for group in power_group_configs:
+			missing = [x for x in group['universes'] if x not in universe_indexes]
+			if missing:
+				raise InvalidLayout(f'power group {group} refers to universes {missing} that are not in the layout')
+			power_groups.append(([universe_indexes[x] for x in group['universes']], group['budget_amps']))
+		return power_groups
+
+	@staticmethod
+	def pack_universes(light_dimensions, strand_runs, first_universe=1, default_destination=None):
+		# assigns strands to universes using as few universes as possible without splitting a strand across two of them
+		# strands keep their wiring order and each receiver's strands are packed separately, so filling every universe
+		# with as many whole strands as fit before starting the next one gives the minimum count
+		receiver_strand_runs = {}
+		for strand_run in strand_runs:
+			destination = strand_run.get('destination', default_destination)
+			receiver_strand_runs.setdefault(destination, []).append(strand_run)
+
+		universes = []
+		for destination, runs in receiver_strand_runs.items():
+			receiver_universes = []
+			used_channels = DMX_CHANNELS_PER_UNIVERSE  # forces a new universe for the first strand
+			for strand_run in runs:
+				strand_channels = 3 * strand_run.get('pixels_per_strand', light_dimensions[1])
+				if strand_channels > DMX_CHANNELS_PER_UNIVERSE:
+					raise InvalidLayout(f'strands in {strand_run} need {strand_channels} channels which is more than one universe')
+
+				placed = 0
+				while placed < strand_run['num_strands']:
+					if used_channels + strand_channels > DMX_CHANNELS_PER_UNIVERSE:
+						uni = {'universe': first_universe + len(universes) + len(receiver_universes), 'start_channel': 1}
+						if destination is not None:
+							uni['destination'] = destination
+						uni['strands'] = []
+						receiver_universes.append(uni)
+						used_channels = 0
+					num_strands = min(strand_run['num_strands'] - placed, (DMX_CHANNELS_PER_UNIVERSE - used_channels) // strand_channels)
+					receiver_universes[-1]['strands'].append(Layout.get_partial_strand_run(strand_run, placed, num_strands))
+					placed += num_strands
+					used_channels += num_strands * strand_channels
+			universes += receiver_universes
+
+		return universes
+
+	@staticmethod
+	def get_partial_strand_run(strand_run, skip_strands, num_strands):
+		# the strand run made of num_strands strands of strand_run starting after its first skip_strands strands
+		start_corner = strand_run.get('start_corner', 'bottom_left')
+		is_serpentine = strand_run.get('serpentine', True)
+		vertical, horizontal = start_corner.split('_')
+		if is_serpentine and skip_strands % 2 == 1:
+			vertical = 'top' if vertical == 'bottom' else 'bottom'
+
+		if horizontal == 'left':
+			first_column = strand_run['first_column'] + skip_strands
+		else:
+			first_column = strand_run['first_column'] + strand_run['num_strands'] - skip_strands - num_strands
+
+		partial_run = {key: value for key, value in strand_run.items() if key != 'destination'}
+		partial_run.update({'first_column': first_column, 'num_strands': num_strands, 'start_corner': f'{vertical}_{horizontal}', 'serpentine': is_serpentine})
+		return partial_run
+
+	@staticmethod
+	def compile_output_map(light_dimensions, universes):
+		L, H, D = light_dimensions
+		universe_pixel_indexes = []
+		universe_channel_offsets = []
+		for uni in universes:
+			pixel_indexes = []
+			for strand_run in uni['strands']:
+				pixel_indexes += Layout.get_strand_run_pixel_indexes(strand_run, light_dimensions)
+
+			start_channel = uni.get('start_channel', 1)
+			if start_channel < 1 or start_channel - 1 + 3 * len(pixel_indexes) > DMX_CHANNELS_PER_UNIVERSE:
+				raise InvalidLayout(f"universe {uni['universe']} needs channels {start_channel} to {start_channel - 1 + 3 * len(pixel_indexes)} which doesn't fit in {DMX_CHANNELS_PER_UNIVERSE}")
+
+			universe_pixel_indexes.append(pixel_indexes)
+			universe_channel_offsets.append(start_channel - 1)
+
+		return OutputMap.from_pixel_indexes(light_dimensions, universe_pixel_indexes, universe_channel_offsets)
+
+	@staticmethod
+	def get_strand_run_pixel_indexes(strand_run, light_dimensions):
+		L, H, D = light_dimensions
+		grid = strand_run['grid']
+		first_column = strand_run['first_column']
+		num_strands = strand_run['num_strands']
+		pixels_per_strand = strand_run.get('pixels_per_strand', H)
+		start_corner = strand_run.get('start_corner', 'bottom_left')
+		is_serpentine = strand_run.get('serpentine', True)
+
+		if start_corner not in ['bottom_left', 'top_left', 'bottom_right', 'top_right']:
+			raise InvalidLayout(f'unknown start_corner {start_corner}')
+		if not (0 <= grid < D) or first_column < 0 or first_column + num_strands > L or pixels_per_strand > H:
+			raise InvalidLayout(f'strand run {strand_run} does not fit in light dimensions {light_dimensions}')
+
+		columns = list(range(first_column, first_column + num_strands))
+		if start_corner.endswith('right'):
+			columns.reverse()
+
+		up_rows = list(range(pixels_per_strand))
+		down_rows = up_rows[::-1]
+		is_up = start_corner.startswith('bottom')
+
+		pixel_indexes = []
+		for column in columns:
+			pixel_indexes += [(column, row, grid) for row in (up_rows if is_up else down_rows)]
+			if is_serpentine:
+				is_up = not is_up
+
+		return pixel_indexes
+
+
+def main(argv):
+	# writes the universes a strands only layout packs into as a regular layout file, for setting up the receivers
+	import argparse
+	parser = argparse.ArgumentParser(description='Pack the strands of a layout into universes and write out the resulting layout')
+	parser.add_argument('layout')
+	parser.add_argument('-o', '--output', default=None, help='file to write the packed layout to, printed when not given')
+	args = parser.parse_args(argv)
+
+	layout = Layout.load(args.layout)
+	# same shape as the hand written layouts, one strand run per line
+	universe_texts = []
+	for uni in layout.universes:
+		fields = [f'\t\t\t"{key}": {json.dumps(value)}' for key, value in uni.items() if key != 'strands']
+		fields.append('\t\t\t"strands": [\n' + ',\n'.join(f'\t\t\t\t{json.dumps(x)}' for x in uni['strands']) + '\n\t\t\t]')
+		universe_texts.append('\t\t{\n' + ',\n'.join(fields) + '\n\t\t}')
+	text = f'{{\n\t"light_dimensions": {json.dumps(list(layout.light_dimensions))},\n\t"universes": [\n' + ',\n'.join(universe_texts) + '\n\t]\n}'
+	if args.output is None:
+		print(text)
+	else:
+		with open(args.output, 'w') as f:
+			f.write(text + '\n')
+
+	num_channels = len(layout.output_map.gather_index)
+	print(f'{num_channels // 3} pixels packed into {layout.output_map.num_universes} universes across {len(set(layout.universe_destinations))} receivers ({100 * num_channels / (DMX_CHANNELS_PER_UNIVERSE * layout.output_map.num_universes):.0f}% of channels used)', file=sys.stderr)
+
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
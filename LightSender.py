@@ -1,136 +1,148 @@
-import sacn
+import numpy as np
+import os
+from contextlib import contextmanager
 from datetime import datetime, time
 import threading
-from time import sleep
+from time import sleep, perf_counter
 
 import global_vars
+from ActivityLog import ActivityLog, ACTIVITY_FILE
+from AllocationStrategies import AllocationPlanner, DEFAULT_STRATEGIES
+from AllocationWorker import AllocationWorker
+from FrameStats import FrameStats
+from FrameRecorder import FrameRecorder, RecordingFull, get_capacity_frames
 from Interlude import Interlude
-from Lights import Lights
+from Layout import Layout
+from OutputBackends import make_output
+from OutputMap import OutputMap
+from PowerLimiter import PowerLimiter
+from TemporalDither import TemporalDither
+from RenderLoop import RenderLoop
 
-IS_UNIVERSE_PER_OUTPUT = False
+LAYOUT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "layouts", "30x10x5.json")
 
-BASE_MOTION_DELAY_SECS = 0.05
+OUTPUT_BACKEND = "sacn"  # sacn, artnet, null, loopback or display
+TARGET_FPS = 20
+TEMPORAL_DITHERING = False  # spread the fractions lost when dimming across frames instead of truncating them
+TRANSITION_FRAMES = 10  # rendered frames the crossfade from the old to the new region layout takes after a reallocation
+INTERPOLATION_STEPS = 2  # frames sent per rendered frame, the ones in between blend towards the newest rendered frame
 TIME_CHECK_TIMER_SECS = 5
-CONTROLLER_IP = "192.168.0.105"
-ACTIVITY_FILE = "/home/pi/interactive-lights/activity.txt"
+INACTIVITY_CHECK_SECS = 5  # how often the render loop asks the controllers whether they've gone inactive
+FRAME_STATS_LOG_INTERVAL_SECS = 60
+MASTER_DIMMING = 0.5
+MASTER_DIMMING_WITH_POWER_LIMITER = 1  # the power limiter protects the supplies so scenes under budget can run at full brightness
+RECORDING_FILE = None  # set to a path to record every rendered frame sent during the session
+ALLOCATION_STRATEGIES = DEFAULT_STRATEGIES  # ways the display may be divided between active controllers, see AllocationStrategies
 
 
 class LightSender:
-	def __init__(self, logger):
+	def __init__(self, logger, target_fps=TARGET_FPS, layout_file=LAYOUT_FILE, output_backend=OUTPUT_BACKEND, recording_file=RECORDING_FILE, interpolation_steps=INTERPOLATION_STEPS, temporal_dithering=TEMPORAL_DITHERING, transition_frames=TRANSITION_FRAMES, activity_file=ACTIVITY_FILE, allocation_strategies=ALLOCATION_STRATEGIES, is_live=True):
+		# is_live=False gives a sender with no timers, render loop or activity logging for offline replay and benchmarks
 		self.logger = logger
+		self.is_live = is_live
 		
 		self.is_test_mode = False
+		self.is_active = False
+		
+		# load the wiring layout, which is compiled into a flat channel map over the frame buffer
+		self.layout = Layout.load(layout_file, self.logger)
+		self.light_dimensions = self.layout.light_dimensions	# L, H, D
+		self.output_map = self.layout.output_map
+		
+		# scale down any power injection group whose estimated current goes over its budget
+		self.power_limiter = None
+		if self.layout.power_groups:
+			group_universe_indexes, group_budget_amps = zip(*self.layout.power_groups)
+			self.power_limiter = PowerLimiter(self.output_map, group_universe_indexes, group_budget_amps, self.layout.milliamps_per_channel)
+		
+		# dithered output changes from frame to frame even when the picture doesn't, so every universe is sent every frame
+		self.dither = TemporalDither(self.output_map) if temporal_dithering else None
 		self.set_master_parameters()
 		
-		# setup the communication with the lights
-		self.sender = sacn.sACNsender()
-		self.sender.start()  # start the sending thread
-		self.universe_senders = []
-		self.universes = []
-
-		# pixel indexes are stored as left/right, up/down, forward/backward or pixel, row, grid
-		for i in range(1,11):
-			self.sender.activate_output(i)
-			self.universe_senders.append(self.sender[i])
-				
-		if IS_UNIVERSE_PER_OUTPUT:
-			self.light_dimensions = L, H, D = 20, 10, 5	# L, H, D
-				
-			for d, sender in enumerate(self.universe_senders):
-				if d < 5:
-					i = d
-					a = 0
-				else:
-					i = d - 5
-					a = 10
-					
-				d = {
-					"universe": sender,
-					"pixel_indexes": [(a+0, x, i) for x in range(10)] +
-						[(a+1, x, i) for x in range(9, -1, -1)] +
-						[(a+2, x, i) for x in range(10)] +
-						[(a+3, x, i) for x in range(9, -1, -1)] +
-						[(a+4, x, i) for x in range(10)] +
-						[(a+5, x, i) for x in range(9, -1, -1)] +
-						[(a+6, x, i) for x in range(10)] +
-						[(a+7, x, i) for x in range(9, -1, -1)] +
-						[(a+8, x, i) for x in range(10)] +
-						[(a+9, x, i) for x in range(9, -1, -1)]
-				}
-				self.universes.append(d)
-		else:
-			self.light_dimensions = L, H, D = 30, 10, 5	# L, H, D
-				
-			for d, sender in enumerate(self.universe_senders):
-				i = int(d / 2)
-				if d % 2 == 0:
-					a = 0
-					d = {
-						"universe": sender,
-						"pixel_indexes": [(a+0, x, i) for x in range(10)] +
-							[(a+1, x, i) for x in range(9, -1, -1)] +
-							[(a+2, x, i) for x in range(10)] +
-							[(a+3, x, i) for x in range(9, -1, -1)] +
-							[(a+4, x, i) for x in range(10)] +
-							[(a+5, x, i) for x in range(9, -1, -1)] +
-							[(a+6, x, i) for x in range(10)] +
-							[(a+7, x, i) for x in range(9, -1, -1)] +
-							[(a+8, x, i) for x in range(10)] +
-							[(a+9, x, i) for x in range(9, -1, -1)] +
-							[(a+10, x, i) for x in range(10)] +
-							[(a+11, x, i) for x in range(9, -1, -1)] +
-							[(a+12, x, i) for x in range(10)] +
-							[(a+13, x, i) for x in range(9, -1, -1)] +
-							[(a+14, x, i) for x in range(10)] +
-							[(a+15, x, i) for x in range(9, -1, -1)] +
-							[(a+16, x, i) for x in range(10)]
-					}
-
-				else:
-					a = 17
-					d = {
-						"universe": sender,
-						"pixel_indexes": [(a+0, x, i) for x in range(9, -1, -1)] +
-							[(a+1, x, i) for x in range(10)] +
-							[(a+2, x, i) for x in range(9, -1, -1)] +
-							[(a+3, x, i) for x in range(10)] +
-							[(a+4, x, i) for x in range(9, -1, -1)] +
-							[(a+5, x, i) for x in range(10)] +
-							[(a+6, x, i) for x in range(9, -1, -1)] +
-							[(a+7, x, i) for x in range(10)] +
-							[(a+8, x, i) for x in range(9, -1, -1)] +
-							[(a+9, x, i) for x in range(10)] +
-							[(a+10, x, i) for x in range(9, -1, -1)] +
-							[(a+11, x, i) for x in range(10)] +
-							[(a+12, x, i) for x in range(9, -1, -1)]
-					}
-				self.universes.append(d)
-			
-		for x in self.universe_senders:
-			x.destination = CONTROLLER_IP
+		# setup the communication with the lights, at the rate the render loop sends frames
+		self.interpolation_steps = max(1, int(interpolation_steps))
+		self.output = make_output(output_backend, self.logger, fps=target_fps * self.interpolation_steps)
+		# each universe goes to the receiver the layout wires it to
+		self.universe_numbers = [uni['universe'] for uni in self.layout.universes]
+		for universe_number, destination in zip(self.universe_numbers, self.layout.universe_destinations):
+			self.output.add_universe(universe_number, destination)
+		self.output.start()
+		self.logger.info(f'Sending to {output_backend} output')
 			
-		# print(self.universes)
-		
-		self.t = None  # thread for handling motion
-		self.time_thread = threading.Timer(TIME_CHECK_TIMER_SECS, self.time_check).start()
-		self.is_active = self.time_check()
+		# the render loop sends interpolation_steps frames for every frame the controllers render
+		self.render_loop = RenderLoop(self.logger, self.next_moving_step, target_fps=target_fps * self.interpolation_steps)  # thread for handling motion
+		self.frame_stats = FrameStats(self.logger, self.render_loop.frame_period, log_interval_secs=FRAME_STATS_LOG_INTERVAL_SECS)
+		if self.is_live:
+			self.time_check()
+		else:
+			self.is_active = True
 		
 		# set up the light matrix mapping
-		self.blackout_packet = Lights.make_blackout_packet(self.light_dimensions)
-		self.current_packet = Lights.make_blackout_packet(self.light_dimensions)
+		self.blackout_packet = OutputMap.make_frame(self.light_dimensions)
+		
+		# controllers compose into the back packet while the front packet is what gets encoded and sent
+		# the two are swapped under a short lock once per flush so the output never sees a half written frame
+		self.back_packet = OutputMap.make_frame(self.light_dimensions)
+		self.front_packet = OutputMap.make_frame(self.light_dimensions)
+		self.frame_lock = threading.Lock()
+		
+		# between rendered frames the output blends from the previous front packet to the current one
+		# pixels of controllers that use hard cuts have a blend mask of 0 and jump straight to the new frame
+		L, H, D = self.light_dimensions
+		self.previous_packet = OutputMap.make_frame(self.light_dimensions)
+		self.output_packet = OutputMap.make_frame(self.light_dimensions)
+		self.blend_mask = np.ones((D, H, L, 1), dtype=np.float32)
+		self.blend_buffer = np.zeros((D, H, L, 3), dtype=np.float32)
+		self.render_tick = 0
+		self.last_inactivity_check = perf_counter()
+		self.interpolation_step = 0
+		self.interpolation_universes = []
+		self.last_sent_packet = self.front_packet
+		
+		# when controllers go active or inactive the frame on the lights is held while the regions are reallocated
+		# and their plans regenerated, then crossfaded into the new layout over transition_secs
+		self.transition_secs = transition_frames / target_fps
+		self.transition_packet = OutputMap.make_frame(self.light_dimensions)
+		self.transition_state = None  # None, 'holding' or 'fading'
+		self.transition_start = 0.0
 		
-		self.write_log_entry('SYSTEM', 'active')
+		# controllers only mark the universes under their region dirty and the render loop flushes them once per tick
+		self.dirty_universes = set(range(self.output_map.num_universes))
+		self.pending_input_times = []  # (controller name, input time) for input whose pixels are waiting to be sent
+		self.last_universe_payloads = [None] * self.output_map.num_universes
+		self.universe_updates_sent = 0
+		self.universe_updates_skipped = 0
+		self.send_lock = threading.Lock()
+		self.activity_lock = threading.Lock()  # guards the controllers' is_active flags, which the render loop and allocation worker both change
+		
+		self.recorder = None
+		if recording_file is not None:
+			self.start_recording(recording_file)
+		
+		# activity entries are written to disk in batches by a background thread
+		self.activity_log = None
+		if self.is_live:
+			self.activity_log = ActivityLog(self.logger, activity_file)
+			self.activity_log.start()
+			self.write_log_entry('SYSTEM', 'active')
 
 		# initiate the interlude sequence across the full display
+		self.allocation_planner = AllocationPlanner(self.logger, self.light_dimensions, allocation_strategies)
 		self.controllers = {}
 		self.add_controller('interlude', Interlude(self.logger, 'interlude', self.light_dimensions, self), 0)
-		self.allocate_pixels()
+		self.allocate_pixels(transition=False)
 		
-		self.next_moving_step()
+		# later reallocations run on their own thread so they never hold up controller input
+		self.allocation_worker = AllocationWorker(self.logger, self.allocate_pixels)
+		if self.is_live:
+			self.allocation_worker.start()
+			self.render_loop.start()
 		
 	def toggle_test_mode(self):
 		self.is_test_mode = not self.is_test_mode
 		self.set_master_parameters()
+		self.update_is_active()
+		self.mark_all_dirty()
 		self.logger.info(f'Test Mode = {self.is_test_mode}')
 		
 	def set_master_parameters(self):
@@ -141,29 +153,60 @@ class LightSender:
 		else:
 			self.start_time = time(16,0,0)
 			self.stop_time = time(22,15,0)
-			self.master_dimming = 0.5
+			self.master_dimming = MASTER_DIMMING if self.power_limiter is None else MASTER_DIMMING_WITH_POWER_LIMITER
 	
-	def time_check(self):
+	def update_is_active(self):
 		now = datetime.now().time()
-		if self.start_time <= now < self.stop_time:
-			self.is_active = True
-		else:
-			self.is_active = False
+		is_active = self.start_time <= now < self.stop_time
+		if is_active != self.is_active:
+			# switch first so the flush that picks up the dirty universes already sends the new state
+			self.is_active = is_active
+			self.mark_all_dirty()
+	
+	def time_check(self):
+		self.update_is_active()
 		
 		if not global_vars.STOP_THREADS:
 			self.time_thread = threading.Timer(TIME_CHECK_TIMER_SECS, self.time_check).start()
 	
 	def next_moving_step(self):
 		now = datetime.now()
+		tick_start = perf_counter()
+		self.frame_stats.record_tick_start(tick_start)
 		try:
-		
-			# call the next_moving_step method of each controller that is active
-			for controller_name, val in self.controllers.items():
-				if val['is_active']:
-					val['controller'].next_moving_step(now)
+			if self.render_tick == 0:
+				# handle the input every controller has queued since the last frame, then call the next_moving_step method
+				# of each controller that is active. a controller's lock is held by the allocation worker while it regenerates
+				# the controller's plans for a new region, so it's left alone until that's done and its input waits in the queue.
+				# ones that just went active hold on to their input and only start moving once they've been given a region
+				is_inactivity_check_due = tick_start - self.last_inactivity_check >= INACTIVITY_CHECK_SECS
+				if is_inactivity_check_due:
+					self.last_inactivity_check = tick_start
+				
+				for controller_name, val in list(self.controllers.items()):
+					if not val['lock'].acquire(blocking=False):
+						continue
+					try:
+						controller = val['controller']
+						has_region = val['pixel_allocation'] is not None
+						controller.process_input_events(has_region=has_region)
+						if is_inactivity_check_due:
+							controller.check_for_inactivity()
+						if val['is_active'] and has_region:
+							controller.next_moving_step(now)
+					finally:
+						val['lock'].release()
+				self.frame_stats.record('controller_update', perf_counter() - tick_start)
 				
-			if not global_vars.STOP_THREADS:
-				self.t = threading.Timer(BASE_MOTION_DELAY_SECS, self.next_moving_step).start()
+				# send whatever the controllers changed during this tick as one frame
+				self.flush(interpolate=self.interpolation_steps > 1)
+			else:
+				self.send_interpolated_frame()
+			self.render_tick = (self.render_tick + 1) % self.interpolation_steps
+			
+			tick_end = perf_counter()
+			self.frame_stats.record('tick', tick_end - tick_start)
+			self.frame_stats.maybe_log_summary(tick_end, self.render_loop)
 		except Exception:
 			self.logger.error('Encountered exception in next moving step thread. Capturing details and hoping things continue to work and/or fix themselves', exc_info=True)
 
@@ -172,49 +215,252 @@ class LightSender:
 			"controller": controller,
 			"index": ordering_index,
 			"is_active": False,
-			"pixel_allocation": None
+			"pixel_allocation": None,
+			"universe_indexes": [],
+			"lock": threading.RLock()  # held while the controller's state is being changed, by the render loop or the allocation worker
 		}
 		
-	def set_lights(self, controller_name, packet):
+	def set_lights(self, controller_name, packet, input_time=None):
+		# input_time is the perf_counter time of the input this packet responds to, if any, for input to light latency
 		try:
-			pixel_ranges = self.controllers[controller_name]['pixel_allocation']
+			controller = self.controllers[controller_name]
+			pixel_ranges = controller['pixel_allocation']
 			if pixel_ranges is not None:
-				# update the current packet
-				range_L, range_H, range_D = pixel_ranges
-				for i, grid in enumerate(packet):
-					if not (range_D[0] <= i <= range_D[1]):
-						continue
-					for j, row in enumerate(grid):
-						if not (range_H[0] <= j <= range_H[1]):
-							continue
-						self.current_packet[i][j][range_L[0]:range_L[1]+1] = row
-							
-				self._send_current_packet()
+				# update the controller's region of the current packet, only flagging its universes if something actually changed
+				if len(packet) > 0:
+					compose_start = perf_counter()
+					new_region = np.asarray(packet, dtype=np.uint8)
+					with self.frame_lock:
+						region = self.get_region(self.back_packet, pixel_ranges)
+						if new_region.shape != region.shape:
+							pass  # made for the controller's region before a reallocation, the regenerated plan will replace it
+						elif not np.array_equal(region, new_region):
+							region[...] = new_region
+							self.dirty_universes.update(controller['universe_indexes'])
+							if input_time is not None:
+								self.pending_input_times.append((controller_name, input_time))
+					self.frame_stats.record('compose', perf_counter() - compose_start)
 		except Exception:
 			self.logger.error(
 				f'Encountered error setting lights for controller[{controller_name}]. Assuming it is a transient problem that will resolve itself next time',
 				exc_info=True
 			)
 						
-	def _send_current_packet(self):
-		if self.is_active:
-			packet = self.current_packet
+	@contextmanager
+	def region(self, controller_name, input_time=None):
+		# a writable view of the controller's region of the back packet, held under the frame lock, for controllers
+		# that render in place rather than building a packet for set_lights. the view is None while the controller
+		# has no pixels. like set_lights, the region's universes are only flagged for the next flush if the block
+		# actually changed its pixels, which is checked against a snapshot kept in a buffer reused between calls
+		compose_start = perf_counter()
+		controller = self.controllers[controller_name]
+		with self.frame_lock:
+			pixel_allocation = controller['pixel_allocation']
+			if pixel_allocation is None:
+				yield None
+				return
+			view = self.get_region(self.back_packet, pixel_allocation)
+			snapshot = controller.get('region_snapshot')
+			if snapshot is None or snapshot.shape != view.shape:
+				snapshot = controller['region_snapshot'] = np.empty_like(view)
+			np.copyto(snapshot, view)
+			yield view
+			if not np.array_equal(view, snapshot):
+				self.dirty_universes.update(controller['universe_indexes'])
+				if input_time is not None:
+					self.pending_input_times.append((controller_name, input_time))
+		self.frame_stats.record('compose', perf_counter() - compose_start)
+	
+	def set_frame(self, frame):
+		# replace the whole back packet, flagging only the universes whose pixels changed
+		with self.frame_lock:
+			changed_pixels = (self.back_packet != frame).any(axis=3)
+			changed_universes = np.flatnonzero((self.output_map.universe_masks & changed_pixels).any(axis=(1, 2, 3)))
+			np.copyto(self.back_packet, frame)
+			self.dirty_universes.update(int(x) for x in changed_universes)
+	
+	def mark_all_dirty(self):
+		with self.frame_lock:
+			self.dirty_universes = set(range(self.output_map.num_universes))
+		
+	def swap_buffers(self):
+		# publish the back packet as the new front packet and hand back the universes that changed
+		# along with the input that went into it
+		# the new back packet starts as a copy of the front so controllers keep composing on top of the latest frame
+		input_times = []
+		with self.frame_lock:
+			universe_indexes = sorted(self.dirty_universes)
+			if universe_indexes:
+				self.front_packet, self.back_packet = self.back_packet, self.front_packet
+				np.copyto(self.back_packet, self.front_packet)
+				self.dirty_universes = set()
+				input_times, self.pending_input_times = self.pending_input_times, []
+		return universe_indexes, input_times
+	
+	def flush(self, force=False, interpolate=False):
+		# with interpolate the changed universes blend from the frame on the lights to the new one over the next
+		# interpolation steps, otherwise the new frame (and any blend still in progress) is sent as a hard cut
+		# a forced flush also cuts any reallocation transition short
+		with self.send_lock:
+			if force:
+				self.transition_state = None
+			if force or self.dither is not None or self.transition_state is not None:
+				self.mark_all_dirty()
+			if interpolate:
+				np.copyto(self.previous_packet, self.front_packet)
+			universe_indexes, input_times = self.swap_buffers()
+			if self.transition_state is not None:
+				self._send_transition_packet()
+			elif interpolate and universe_indexes:
+				self.interpolation_universes = universe_indexes
+				self.interpolation_step = 1
+				self.update_blend_mask(set(name for name, input_time in input_times))
+				self._send_blended_packet(self.interpolation_universes, self.previous_packet, self.interpolation_step / self.interpolation_steps, self.blend_mask)
+			else:
+				universe_indexes = sorted(set(universe_indexes).union(self.interpolation_universes))
+				self.interpolation_universes = []
+				if universe_indexes:
+					self._send_current_packet(universe_indexes)
+			if universe_indexes:
+				self._record_input_latencies(input_times)
+	
+	def send_interpolated_frame(self):
+		with self.send_lock:
+			if self.transition_state is not None:
+				self._send_transition_packet()
+			elif self.interpolation_universes:
+				# the last step lands on the rendered frame, which is the one that gets recorded
+				self.interpolation_step += 1
+				is_last_step = self.interpolation_step >= self.interpolation_steps
+				self._send_blended_packet(self.interpolation_universes, self.previous_packet, self.interpolation_step / self.interpolation_steps, self.blend_mask, record=is_last_step)
+				if is_last_step:
+					self.interpolation_universes = []
+	
+	def update_blend_mask(self, input_controller_names=()):
+		# regions showing a response to input in this frame are cut to straight away too, so drum hits and strums
+		# aren't delayed by the blend
+		self.blend_mask.fill(1)
+		for controller_name, val in list(self.controllers.items()):
+			try:
+				uses_hard_cuts = val['is_active'] and val['pixel_allocation'] is not None and (controller_name in input_controller_names or val['controller'].uses_hard_cuts())
+			except AttributeError:
+				uses_hard_cuts = False
+			if uses_hard_cuts:
+				self.get_region(self.blend_mask, val['pixel_allocation'])[...] = 0
+	
+	def _send_blended_packet(self, universe_indexes, from_packet, t, blend_mask=None, record=False):
+		# output = front - (front - from) * (1 - t) * mask, worked out in place in the preallocated float buffer
+		np.subtract(self.front_packet, from_packet, out=self.blend_buffer, dtype=np.float32)
+		self.blend_buffer *= 1 - t
+		if blend_mask is not None:
+			self.blend_buffer *= blend_mask
+		np.subtract(self.front_packet, self.blend_buffer, out=self.blend_buffer, dtype=np.float32)
+		self.blend_buffer += 0.5
+		np.copyto(self.output_packet, self.blend_buffer, casting='unsafe')
+		self._send_current_packet(universe_indexes, self.output_packet, record=record)
+	
+	def start_transition(self):
+		# hold whatever is on the lights until finish_transition is called
+		with self.send_lock:
+			np.copyto(self.transition_packet, self.last_sent_packet)
+			self.transition_state = 'holding'
+			self.interpolation_universes = []
+	
+	def finish_transition(self):
+		# the new layout is ready so start fading into it
+		with self.send_lock:
+			if self.transition_state is not None:
+				self.transition_start = perf_counter()
+				self.transition_state = 'fading'
+	
+	def _send_transition_packet(self):
+		all_universes = list(range(self.output_map.num_universes))
+		t = 0.0
+		if self.transition_state == 'fading':
+			t = (perf_counter() - self.transition_start) / self.transition_secs
+		if t >= 1:
+			self.transition_state = None
+			self._send_current_packet(all_universes)
 		else:
+			self._send_blended_packet(all_universes, self.transition_packet, t)
+	
+	def _record_input_latencies(self, input_times):
+		now = perf_counter()
+		for controller_name, input_time in input_times:
+			try:
+				mode = self.controllers[controller_name]['controller'].get_mode()
+			except (KeyError, AttributeError):
+				mode = None
+			self.frame_stats.record_input_latency(controller_name, mode, now - input_time)
+	
+	def _send_current_packet(self, universe_indexes=None, packet=None, record=True):
+		# only rendered frames are recorded, the blends in between and during transitions can be rebuilt from them
+		if not self.is_active:
 			packet = self.blackout_packet
+		elif packet is None:
+			packet = self.front_packet
+		self.last_sent_packet = packet
 			
 		# send the current packet to the universes
 		try:
-			for uni in self.universes:
-				uni_packet = []
-				for pixel in uni['pixel_indexes']:
-					p, r, g = pixel
-					uni_packet += [int(self.master_dimming * x) for x in packet[g][r][p]]
-				
-				# print(uni_packet)
-				uni['universe'].dmx_data = uni_packet
+			if universe_indexes is None:
+				universe_indexes = range(self.output_map.num_universes)
+			encode_start = perf_counter()
+			self.output_map.encode(packet, self.master_dimming, universe_indexes)
+			if self.power_limiter is not None:
+				limited_universes = self.power_limiter.limit()
+				if limited_universes:
+					universe_indexes = sorted(set(universe_indexes).union(limited_universes))
+			if self.dither is not None:
+				self.dither.apply(self.power_limiter.universe_scales if self.power_limiter is not None else ())
+			payloads = [(u, self.output_map.get_payload(u)) for u in universe_indexes]
+			handoff_start = perf_counter()
+			self.frame_stats.record('encode', handoff_start - encode_start)
+			self.universe_updates_skipped += self.output_map.num_universes - len(universe_indexes)
+			
+			for u, payload in payloads:
+				if payload == self.last_universe_payloads[u]:
+					self.universe_updates_skipped += 1
+					continue
+				self.output.send(self.universe_numbers[u], payload)
+				self.last_universe_payloads[u] = payload
+				self.universe_updates_sent += 1
+			
+			timestamp = datetime.now().timestamp()
+			self.output.end_frame(timestamp)
+			if record and self.recorder is not None:
+				self._record_frame(timestamp)
+			self.frame_stats.record('handoff', perf_counter() - handoff_start)
 		except Exception:
 			self.logger.error('Encountered error sending the current packet. Assuming it is a transient problem that will resolve itself next time', exc_info=True)
 	
+	def _record_frame(self, timestamp):
+		try:
+			self.recorder.append(timestamp, self.output_map.channel_buffer)
+		except RecordingFull:
+			self.logger.warning(f'Recording {self.recorder.path} is full so recording has been stopped')
+			self.recorder.close()
+			self.recorder = None
+	
+	def start_recording(self, path, capacity_frames=None):
+		# only rendered frames are recorded, so by default the recording is sized for a whole night at the rendered rate
+		if capacity_frames is None:
+			capacity_frames = get_capacity_frames(self.render_loop.target_fps / self.interpolation_steps)
+		recorder = FrameRecorder(path, self.output_map, self.universe_numbers, capacity_frames, created_time=datetime.now().timestamp())
+		with self.send_lock:
+			previous, self.recorder = self.recorder, recorder
+		if previous is not None:
+			previous.close()
+		self.mark_all_dirty()  # make sure the recording starts with a complete frame
+		self.logger.info(f'Recording frames to {path} with room for {capacity_frames} frames')
+		
+	def stop_recording(self):
+		with self.send_lock:
+			recorder, self.recorder = self.recorder, None
+		if recorder is not None:
+			recorder.close()
+			self.logger.info(f'Stopped recording to {recorder.path} after {recorder.frame_count} frames')
+	
 	def stop(self):
 		self.logger.info('Stopping light sender')
 		for key, value in self.controllers.items():
@@ -223,101 +469,162 @@ class LightSender:
 				value['controller'].controller.close()
 		
 		self.write_log_entry('SYSTEM', 'inactive')
+		self.render_loop.stop()
+		self.allocation_worker.stop()
 		self.allocate_pixels(is_final=True)
-		self.current_packet = self.blackout_packet
-		self._send_current_packet()
+		with self.frame_lock:
+			self.back_packet.fill(0)
+		self.flush(force=True)
 		self.logger.info('Sending final packet')
+		self.stop_recording()
 		
 		self.logger.info('Setting variable to stop threads')		
 		global_vars.STOP_THREADS = True
 		sleep(1)
 		
+		self.logger.info(f'Render loop ran {self.render_loop.frame_count} frames with {self.render_loop.overrun_count} overruns ({self.render_loop.skipped_frame_count} frames skipped, max overrun {self.render_loop.max_overrun_secs * 1000:.1f} ms)')
+		
+		coalesced_event_count = sum(getattr(val['controller'], 'coalesced_event_count', 0) for val in self.controllers.values())
+		self.logger.info(f'Coalesced {coalesced_event_count} axis events into newer ones before handling them')
+		self.logger.info(f'Ran {self.allocation_worker.allocation_count} reallocations on the allocation worker ({self.allocation_worker.coalesced_request_count} requests coalesced, {self.allocation_planner.cache_hits} layouts reused from the cache)')
+		self.logger.info(f'Sent {self.universe_updates_sent} universe updates and skipped {self.universe_updates_skipped} unchanged ones')
+		if self.power_limiter is not None:
+			self.logger.info(f'Power limiter scaled down {self.power_limiter.frames_limited} frames. Peak group current estimates were ' + ', '.join(f'{x:.1f}' for x in self.power_limiter.max_group_amps) + ' A')
+		
 		self.logger.info('Stopping sender')
-		self.sender.stop()
+		self.output.stop()
+		if self.activity_log is not None:
+			self.activity_log.stop()
 		self.logger.info('Shutdown complete!')
 		
 	def go_inactive(self, name):
 		self.logger.info(f'{name} is inactive')
-		self.controllers[name]["is_active"] = False
+		with self.activity_lock:
+			self.controllers[name]["is_active"] = False
 		self.write_log_entry(name, 'inactive')
 		
 		# update the rest of the controllers pixel allocations
-		self.allocate_pixels()
+		self.request_allocation()
 	
 	def go_active(self, name):
 		self.logger.info(f'{name} is active')
-		self.controllers[name]["is_active"] = True
-		self.controllers['interlude']['is_active'] = False
+		with self.activity_lock:
+			self.controllers[name]["is_active"] = True
+			self.controllers['interlude']['is_active'] = False
 		self.write_log_entry(name, 'active')
 		
 		# update the controllers pixel allocations
-		self.allocate_pixels()
+		self.request_allocation()
+	
+	def request_allocation(self):
+		# live senders reallocate on the allocation worker, offline ones right away
+		if self.is_live:
+			self.allocation_worker.request()
+		else:
+			self.allocate_pixels()
 		
 	def write_log_entry(self, controller_name, state):
-		try:
-			now = datetime.now().strftime('%Y-%m-%dT%H:%M:%S')
-			entry = f"{now} {controller_name} {state}\n"
-			with open(ACTIVITY_FILE, 'a') as f:
-				f.write(entry)
-		except Exception:
-			self.logger.error('Encountered error writing to activity log file', exc_info=True)
+		# only queues the entry, so this is safe to call from controller callbacks
+		if self.activity_log is not None:
+			self.activity_log.write(controller_name, state)
 			
 	@staticmethod
-	def determine_L_vals(L, num_active):
-		# first determine the allocation size for each
-		new_L = int(L / num_active)
-		L_array = [new_L] * num_active
-		add_ind = 0
-		while sum(L_array) < L:
-			L_array[add_ind] += 1
-			add_ind += 1
-			
-		# now generate the actual cutoff points for each
-		L_ranges = []
-		for i, val in enumerate(L_array):
-			L_ranges.append((sum(L_array[:i]), sum(L_array[:i+1])-1))
-			
-		return L_ranges
+	def get_allocation_dimensions(pixel_allocation):
+		range_L, range_H, range_D = pixel_allocation
+		return range_L[1] - range_L[0] + 1, range_H[1] - range_H[0] + 1, range_D[1] - range_D[0] + 1
+	
+	@staticmethod
+	def get_region(packet, pixel_allocation):
+		range_L, range_H, range_D = pixel_allocation
+		return packet[range_D[0]:range_D[1]+1, range_H[0]:range_H[1]+1, range_L[0]:range_L[1]+1]
+	
+	def allocate_pixels(self, is_final=False, transition=True):
+		# with transition the old frame stays up while the controllers regenerate for their new regions
+		# and is then crossfaded into the new layout
+		is_transition = transition and not is_final and self.transition_secs > 0
+		if is_transition:
+			self.start_transition()
 		
-	def allocate_pixels(self, is_final=False):
 		try:
-			num_active = len([k for k, v in self.controllers.items() if v["is_active"]])
+			# who's active and whether the interlude comes back on are decided together under the activity lock, so a
+			# controller going active in between can't be overwritten with a stale view. its own request follows this run
+			with self.activity_lock:
+				active = [(k, v["controller"]) for k, v in sorted(self.controllers.items(), key=lambda x: x[1]['index']) if v["is_active"]]
+				if len(active) == 0:
+					self.controllers['interlude']['is_active'] = True if not is_final else False
 			L, H, D = self.light_dimensions
 			
-			if num_active == 0:
-				pixel_ranges = [([0, L-1], [0, H-1], [0, D-1])]
-				self.controllers['interlude']['is_active'] = True if not is_final else False
+			if len(active) == 0:
+				pixel_ranges = {'interlude': ([0, L-1], [0, H-1], [0, D-1])} if not is_final else {}
 			else:
-				L_ranges = self.determine_L_vals(L, num_active)
-					
-				pixel_ranges = []
-				for item in L_ranges:
-					# pixel_range is tuple of L, H, D ranges
-					pixel_range = [item[0], item[1]], [0, H-1], [0, D-1]
-					pixel_ranges.append(pixel_range)
+				# the planner picks which way to divide the display, weighing each controller's minimum size
+				# against what it costs to regenerate its plans for a new size
+				current_allocations = {k: v["pixel_allocation"] for k, v in self.controllers.items()}
+				pixel_ranges = self.allocation_planner.plan(active, current_allocations)
 			
-			range_index = 0
-			for key, value in sorted(self.controllers.items(), key=lambda x: x[1]['index']):
-				shared_left = shared_right = False
-				if value["is_active"]:
-					if range_index > 0:
-						shared_left = True
-					if len(pixel_ranges) > 1 and range_index < len(pixel_ranges) - 1:
-						shared_right = True
-					range_L, range_H, range_D = pixel_ranges[range_index]
+			# work out the new allocation of every controller before touching any of them
+			# a side is shared when the region doesn't reach that end of the display along L
+			new_allocations = {}
+			for key in self.controllers:
+				pixel_allocation = pixel_ranges.get(key)
+				if pixel_allocation is not None:
+					range_L = pixel_allocation[0]
+					new_allocations[key] = tuple(pixel_allocation), (range_L[0] > 0, range_L[1] < L - 1)
+				else:
+					new_allocations[key] = None, None
+			
+			# only controllers whose region changed size regenerate their plans, which is when they're told about shared sides
+			# (no controller draws differently for them). ones that only moved keep their plans and have their current
+			# pixels copied over to the new location
+			resized = []
+			moved = []
+			for key, (pixel_allocation, shared_sides) in new_allocations.items():
+				old_allocation = self.controllers[key]["pixel_allocation"]
+				if pixel_allocation is None or old_allocation == pixel_allocation:
+					pass
+				elif old_allocation is None or self.get_allocation_dimensions(old_allocation) != self.get_allocation_dimensions(pixel_allocation):
+					resized.append(key)
+				else:
+					moved.append(key)
+			
+			# take the locks of the controllers being resized before they get their new regions, which waits for the render
+			# loop to finish whatever it's doing with them and keeps it away until their plans have been regenerated
+			locked = []
+			try:
+				for key in resized:
+					self.controllers[key]["lock"].acquire()
+					locked.append(key)
+				
+				with self.frame_lock:
+					moved_pixels = [(new_allocations[key][0], self.get_region(self.back_packet, self.controllers[key]["pixel_allocation"]).copy()) for key in moved]
 					
-					value["pixel_allocation"] = range_L, range_H, range_D
-					value["controller"].update_pixel_allocation(
-						light_dimensions = (range_L[1] - range_L[0] + 1, range_H[1] - range_H[0] + 1, range_D[1] - range_D[0] + 1),
+					for key, (pixel_allocation, shared_sides) in new_allocations.items():
+						value = self.controllers[key]
+						value["pixel_allocation"] = pixel_allocation
+						value["universe_indexes"] = self.output_map.get_universe_indexes(pixel_allocation)
+					
+					for pixel_allocation, pixels in moved_pixels:
+						self.get_region(self.back_packet, pixel_allocation)[...] = pixels
+						self.dirty_universes.update(self.output_map.get_universe_indexes(pixel_allocation))
+				
+				for key in resized:
+					pixel_allocation, (shared_left, shared_right) = new_allocations[key]
+					self.controllers[key]["controller"].update_pixel_allocation(
+						light_dimensions=self.get_allocation_dimensions(pixel_allocation),
 						is_left_shared=shared_left,
 						is_right_shared=shared_right
 					)
-					range_index += 1
-				else:
-					value["pixel_allocation"] = None
+					self.controllers[key]["lock"].release()
+					locked.remove(key)
+			finally:
+				for key in locked:
+					self.controllers[key]["lock"].release()
 			
 			out = [f"{k}: {v['pixel_allocation']}" for k, v in self.controllers.items()]
-			self.logger.info(f'Current pixel allocation is as follows: {out}')
+			self.logger.info(f'Current pixel allocation is as follows: {out} (regenerated {resized}, moved {moved})')
 		except Exception:
 			self.logger.error('Encountered error allocating pixels. Assuming it will take care of itself with next button push.', exc_info=True)
+		
+		if is_transition:
+			self.finish_transition()
 			
\ No newline at end of file
@@ -1,6 +1,8 @@
 from random import randint
 from copy import deepcopy
 
+import numpy as np
+
 
 class Lights:
 	COLOR_LIST = ["green", "red", "yellow", "blue", "orange", "white", "black", "purple", "pink", "teal"]
@@ -524,6 +526,16 @@ class Lights:
 			
 		return new_packet
 	
+	@staticmethod
+	def merge_packet_arrays(packet_arrays, out, merge_buffer):
+		# merge_packets for uint8 packet arrays, adding them (capped at 255) straight into out, usually a region view
+		# merge_buffer is a uint16 array with the same shape as out that the caller keeps around between frames
+		merge_buffer.fill(0)
+		for packet_array in packet_arrays:
+			merge_buffer += packet_array
+		np.minimum(merge_buffer, 255, out=merge_buffer)
+		np.copyto(out, merge_buffer, casting='unsafe')
+	
 	@staticmethod
 	def make_rainbow_row(num_pixels, color_shift=0):
 		colors = ["red", "orange", "yellow", "green", "blue", "purple"]
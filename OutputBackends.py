@@ -0,0 +1,294 @@
+import math
+import socket
+import threading
+from collections import deque
+
+import numpy as np
+
+ARTNET_PORT = 6454
+DMX_CHANNELS_PER_UNIVERSE = 512
+LOOPBACK_MAX_FRAMES = 10000
+
+
+class BaseOutput:
+	# an output backend receives the DMX payload of every universe that changed in a frame
+	# followed by end_frame once all of them have been handed over
+	sends_on_own_thread = False  # True when send only hands the payload to a thread of the backend's own
+
+	def __init__(self, logger):
+		self.logger = logger
+		self.universe_destinations = {}
+		self.frames_sent = 0
+		self.universe_packets_sent = 0
+		self.bytes_sent = 0
+
+	def add_universe(self, universe_number, destination):
+		self.universe_destinations[universe_number] = destination
+
+	def start(self):
+		pass
+
+	def send(self, universe_number, payload):
+		self.universe_packets_sent += 1
+		self.bytes_sent += len(payload)
+
+	def end_frame(self, timestamp):
+		self.frames_sent += 1
+
+	def stop(self):
+		pass
+
+
+class SacnOutput(BaseOutput):
+	# E1.31 through the sacn library, which sends from its own thread
+	sends_on_own_thread = True
+
+	def __init__(self, logger, fps=None):
+		# the sending thread only sends the latest data of each universe on its own clock, so it has to run at
+		# the rate frames are sent (interpolated ones included) or frames are dropped at irregular times
+		super().__init__(logger)
+		import sacn
+		self.sender = sacn.sACNsender() if fps is None else sacn.sACNsender(fps=int(math.ceil(fps)))
+
+	def add_universe(self, universe_number, destination):
+		super().add_universe(universe_number, destination)
+		self.sender.activate_output(universe_number)
+		self.sender[universe_number].destination = destination
+
+	def start(self):
+		self.sender.start()  # start the sending thread
+
+	def send(self, universe_number, payload):
+		super().send(universe_number, payload)
+		self.sender[universe_number].dmx_data = payload
+
+	def stop(self):
+		self.sender.stop()
+
+
+class ArtNetOutput(BaseOutput):
+	# raw UDP ArtDmx packets sent straight from the caller's thread
+	# art-net universes count from 0 so universe 1 in the layout goes out as art-net universe 0
+	def __init__(self, logger):
+		super().__init__(logger)
+		self.sock = None
+		self.sequence = 1
+
+	def start(self):
+		self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+	@staticmethod
+	def make_artdmx_header(universe_number, sequence, data_length):
+		art_universe = universe_number - 1
+		return (
+			b'Art-Net\x00' +
+			(0x5000).to_bytes(2, 'little') +  # OpDmx
+			(14).to_bytes(2, 'big') +  # protocol version
+			bytes([sequence, 0]) +
+			art_universe.to_bytes(2, 'little') +
+			data_length.to_bytes(2, 'big')
+		)
+
+	def send(self, universe_number, payload):
+		super().send(universe_number, payload)
+		if len(payload) % 2:
+			payload += b'\x00'  # ArtDmx data length has to be even
+		packet = self.make_artdmx_header(universe_number, self.sequence, len(payload)) + payload
+		self.sock.sendto(packet, (self.universe_destinations[universe_number], ARTNET_PORT))
+
+	def end_frame(self, timestamp):
+		super().end_frame(timestamp)
+		self.sequence = 1 if self.sequence == 255 else self.sequence + 1  # 0 disables sequencing
+
+	def stop(self):
+		if self.sock is not None:
+			self.sock.close()
+			self.sock = None
+
+
+class NullOutput(BaseOutput):
+	# drops everything and just counts what would have been sent
+	pass
+
+
+class LoopbackOutput(BaseOutput):
+	# keeps the most recent frames in memory as (timestamp, {universe_number: payload}) for tests and benchmarks
+	def __init__(self, logger, max_frames=LOOPBACK_MAX_FRAMES):
+		super().__init__(logger)
+		self.universe_data = {}
+		self.frames = deque(maxlen=max_frames)
+
+	def add_universe(self, universe_number, destination):
+		super().add_universe(universe_number, destination)
+		self.universe_data[universe_number] = b''
+
+	def send(self, universe_number, payload):
+		super().send(universe_number, payload)
+		self.universe_data[universe_number] = payload
+
+	def end_frame(self, timestamp):
+		super().end_frame(timestamp)
+		self.frames.append((timestamp, dict(self.universe_data)))
+
+
+class SharedFrameOutput(BaseOutput):
+	# copies every universe into one preallocated num_universes x 512 buffer that local readers such as the
+	# virtual display can look at without getting their own copy of each frame
+	# sequence is odd while a frame is being written and even once it is complete, so readers can spot torn reads
+	def __init__(self, logger):
+		super().__init__(logger)
+		self.universe_rows = {}
+		self.channels = None
+		self.sequence = 0
+		self.frame_timestamp = 0.0
+
+	def add_universe(self, universe_number, destination):
+		super().add_universe(universe_number, destination)
+		self.universe_rows[universe_number] = len(self.universe_rows)
+
+	def start(self):
+		self.channels = np.zeros((len(self.universe_rows), DMX_CHANNELS_PER_UNIVERSE), dtype=np.uint8)
+
+	def send(self, universe_number, payload):
+		super().send(universe_number, payload)
+		if self.sequence % 2 == 0:
+			self.sequence += 1
+		self.channels[self.universe_rows[universe_number], :len(payload)] = np.frombuffer(payload, dtype=np.uint8)
+
+	def end_frame(self, timestamp):
+		super().end_frame(timestamp)
+		self.frame_timestamp = timestamp
+		if self.sequence % 2 == 1:
+			self.sequence += 1
+
+
+class ReceiverShard:
+	# the universes that go to one receiver, sent through a backend instance of their own
+	# backends that send from the caller's thread get a sender thread here so one slow or unreachable receiver
+	# can't hold up the others. the render loop never waits on it: if the previous frame hasn't gone out yet the
+	# new payloads are merged into it and the older frame is counted as dropped
+	def __init__(self, logger, destination, output):
+		self.logger = logger
+		self.destination = destination
+		self.output = output
+		self.payloads = {}  # universe number -> payload for the frame being built
+		self.queued_payloads = None
+		self.queued_timestamp = None
+		self.frames_dropped = 0
+		self.is_stopping = False
+		self.condition = threading.Condition()
+		self.thread = None
+
+	def start(self):
+		self.output.start()
+		if not self.output.sends_on_own_thread:
+			self.thread = threading.Thread(target=self.run, name=f'output_{self.destination}', daemon=True)
+			self.thread.start()
+
+	def end_frame(self, timestamp):
+		payloads, self.payloads = self.payloads, {}
+		if self.thread is None:
+			self.send_frame(payloads, timestamp)
+			return
+
+		with self.condition:
+			if self.queued_payloads is not None:
+				self.frames_dropped += 1
+				self.queued_payloads.update(payloads)
+			else:
+				self.queued_payloads = payloads
+			self.queued_timestamp = timestamp
+			self.condition.notify()
+
+	def send_frame(self, payloads, timestamp):
+		for universe_number, payload in payloads.items():
+			self.output.send(universe_number, payload)
+		self.output.end_frame(timestamp)
+
+	def run(self):
+		while True:
+			with self.condition:
+				while self.queued_payloads is None and not self.is_stopping:
+					self.condition.wait()
+				if self.queued_payloads is None:
+					return
+				payloads, self.queued_payloads = self.queued_payloads, None
+				timestamp = self.queued_timestamp
+			try:
+				self.send_frame(payloads, timestamp)
+			except Exception:
+				self.logger.error(f'Encountered error sending to {self.destination}. Carrying on with the next frame', exc_info=True)
+
+	def stop(self):
+		# anything already queued (such as the final blackout) is sent before the thread finishes
+		if self.thread is not None:
+			with self.condition:
+				self.is_stopping = True
+				self.condition.notify()
+			self.thread.join(timeout=2)
+		self.output.stop()
+
+
+class ShardedOutput(BaseOutput):
+	# fans a network backend out over several receivers: universes are grouped by destination and every receiver
+	# gets its own backend instance (and so its own socket and sending thread), so adding a pixel controller
+	# adds sending capacity rather than lengthening one serialized send path
+	def __init__(self, logger, backend_class, **backend_kwargs):
+		super().__init__(logger)
+		self.backend_class = backend_class
+		self.backend_kwargs = backend_kwargs
+		self.shards = {}  # destination -> ReceiverShard
+		self.universe_shards = {}
+
+	def add_universe(self, universe_number, destination):
+		super().add_universe(universe_number, destination)
+		if destination not in self.shards:
+			self.shards[destination] = ReceiverShard(self.logger, destination, self.backend_class(self.logger, **self.backend_kwargs))
+		self.shards[destination].output.add_universe(universe_number, destination)
+		self.universe_shards[universe_number] = self.shards[destination]
+
+	def start(self):
+		for shard in self.shards.values():
+			shard.start()
+		self.logger.info(f'Sending to {len(self.shards)} receivers: ' + ', '.join(f'{x.destination} ({len(x.output.universe_destinations)} universes)' for x in self.shards.values()))
+
+	def send(self, universe_number, payload):
+		super().send(universe_number, payload)
+		self.universe_shards[universe_number].payloads[universe_number] = payload
+
+	def end_frame(self, timestamp):
+		super().end_frame(timestamp)
+		for shard in self.shards.values():
+			if shard.payloads:
+				shard.end_frame(timestamp)
+
+	def stop(self):
+		for shard in self.shards.values():
+			shard.stop()
+			if shard.frames_dropped:
+				self.logger.info(f'{shard.destination} fell behind and dropped {shard.frames_dropped} frames')
+
+
+OUTPUT_BACKENDS = {
+	'sacn': SacnOutput,
+	'artnet': ArtNetOutput,
+	'null': NullOutput,
+	'loopback': LoopbackOutput,
+	'display': SharedFrameOutput
+}
+
+
+# backends that put packets on the network, which are sharded by receiver
+NETWORK_BACKENDS = ['sacn', 'artnet']
+
+
+def make_output(name, logger, fps=None):
+	# fps is the rate frames will be sent at, passed on to backends that send on a clock of their own
+	if name not in OUTPUT_BACKENDS:
+		raise ValueError(f'Unknown output backend {name}. Expected one of {list(OUTPUT_BACKENDS)}')
+	backend_kwargs = {}
+	if fps is not None and OUTPUT_BACKENDS[name].sends_on_own_thread:
+		backend_kwargs['fps'] = fps
+	if name in NETWORK_BACKENDS:
+		return ShardedOutput(logger, OUTPUT_BACKENDS[name], **backend_kwargs)
+	return OUTPUT_BACKENDS[name](logger, **backend_kwargs)
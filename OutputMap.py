@@ -0,0 +1,83 @@
+import numpy as np
+
+
+class OutputMap:
+	# frames are stored as one contiguous uint8 array of shape D x H x L x RGB
+	# the (pixel, row, grid) wiring of every universe is compiled once into a flat gather index into that array
+	# so building all of the universe payloads is a single take plus scale with no per pixel python work
+	def __init__(self, light_dimensions, gather_index, universe_slices, universe_channel_offsets=None):
+		self.light_dimensions = L, H, D = light_dimensions
+		self.gather_index = np.asarray(gather_index, dtype=np.intp)
+		self.universe_slices = [(int(start), int(stop)) for start, stop in universe_slices]
+		self.num_universes = len(self.universe_slices)
+
+		# universes that don't start at channel 1 get zero padding in front of their pixel data
+		if universe_channel_offsets is None:
+			universe_channel_offsets = [0] * self.num_universes
+		self.universe_padding = [bytes(int(x)) for x in universe_channel_offsets]
+
+		# which pixels feed each universe
+		self.universe_masks = np.zeros((self.num_universes, D * H * L), dtype=bool)
+		for u, (start, stop) in enumerate(self.universe_slices):
+			self.universe_masks[u, self.gather_index[start:stop:3] // 3] = True
+		self.universe_masks = self.universe_masks.reshape((self.num_universes, D, H, L))
+
+		# buffers are allocated once and reused for every frame
+		num_channels = len(self.gather_index)
+		self.gathered = np.zeros(num_channels, dtype=np.uint8)
+		self.scaled = np.zeros(num_channels, dtype=np.float32)
+		self.channel_buffer = np.zeros(num_channels, dtype=np.uint8)
+		self.universe_buffers = [self.channel_buffer[start:stop] for start, stop in self.universe_slices]
+
+	@classmethod
+	def from_pixel_indexes(cls, light_dimensions, universe_pixel_indexes, universe_channel_offsets=None):
+		# universe_pixel_indexes is a list per universe of (pixel, row, grid) tuples in wiring order
+		L, H, D = light_dimensions
+		gather_index = []
+		universe_slices = []
+		for pixel_indexes in universe_pixel_indexes:
+			start = len(gather_index)
+			for p, r, g in pixel_indexes:
+				base = ((g * H + r) * L + p) * 3
+				gather_index += [base, base + 1, base + 2]
+			universe_slices.append((start, len(gather_index)))
+
+		return cls(light_dimensions, gather_index, universe_slices, universe_channel_offsets)
+
+	@staticmethod
+	def make_frame(light_dimensions):
+		L, H, D = light_dimensions
+		return np.zeros((D, H, L, 3), dtype=np.uint8)
+
+	def get_universe_indexes(self, pixel_ranges):
+		# the universes that carry at least one pixel of the given L, H, D ranges
+		if pixel_ranges is None:
+			return []
+		range_L, range_H, range_D = pixel_ranges
+		region_masks = self.universe_masks[:, range_D[0]:range_D[1]+1, range_H[0]:range_H[1]+1, range_L[0]:range_L[1]+1]
+		return [int(x) for x in np.flatnonzero(region_masks.any(axis=(1, 2, 3)))]
+
+	def encode(self, frame, master_dimming, universe_indexes=None):
+		# gather every channel in output order, scale it and truncate it into the per universe byte buffers
+		# when universe indexes are given, only those universes are re-encoded and the rest keep their previous bytes
+		flat_frame = frame.reshape(-1)
+		if universe_indexes is None:
+			np.take(flat_frame, self.gather_index, out=self.gathered)
+			np.multiply(self.gathered, master_dimming, out=self.scaled)
+			np.copyto(self.channel_buffer, self.scaled, casting='unsafe')
+		else:
+			for u in universe_indexes:
+				start, stop = self.universe_slices[u]
+				np.take(flat_frame, self.gather_index[start:stop], out=self.gathered[start:stop])
+				np.multiply(self.gathered[start:stop], master_dimming, out=self.scaled[start:stop])
+				np.copyto(self.channel_buffer[start:stop], self.scaled[start:stop], casting='unsafe')
+		return self.universe_buffers
+
+	def get_payload(self, universe_index):
+		# the DMX data for one universe as sent on the wire, starting at channel 1
+		return self.universe_padding[universe_index] + self.universe_buffers[universe_index].tobytes()
+
+	def decode(self, channels, frame):
+		# the inverse of encode without dimming: scatter a full channel buffer back into a frame
+		frame.reshape(-1)[self.gather_index] = channels
+		return frame
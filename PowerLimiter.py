@@ -0,0 +1,65 @@
+import numpy as np
+
+MILLIAMPS_PER_CHANNEL = 20  # a WS2811 pixel draws about 20 mA per colour at full brightness
+
+
+class PowerLimiter:
+	# estimates the current every power injection group draws from the dimmed channel values of the universes it feeds
+	# and scales down just the groups that are over their budget, so one full white flash can't overdraw a supply
+	# while the rest of the display keeps its brightness. groups are made of whole universes so the estimate is one
+	# reduceat over the channel buffer plus a small matrix product per frame
+	def __init__(self, output_map, group_universe_indexes, group_budget_amps, milliamps_per_channel=MILLIAMPS_PER_CHANNEL):
+		self.output_map = output_map
+		self.group_universe_indexes = [list(x) for x in group_universe_indexes]
+		self.num_groups = len(self.group_universe_indexes)
+		self.group_budget_amps = np.asarray(group_budget_amps, dtype=np.float32)
+		self.amps_per_channel_value = np.float32(milliamps_per_channel / 1000 / 255)
+
+		# universe slices are contiguous in the channel buffer, so each universe's channel sum is a reduceat from its start
+		self.universe_starts = np.array([start for start, stop in output_map.universe_slices], dtype=np.intp)
+		self.group_members = np.zeros((self.num_groups, output_map.num_universes), dtype=np.float32)
+		for g, universe_indexes in enumerate(self.group_universe_indexes):
+			self.group_members[g, universe_indexes] = 1
+
+		# buffers are allocated once and reused for every frame
+		self.universe_sums = np.zeros(output_map.num_universes, dtype=np.float32)
+		self.group_amps = np.zeros(self.num_groups, dtype=np.float32)
+		self.group_scales = np.ones(self.num_groups, dtype=np.float32)
+		self.last_group_scales = np.ones(self.num_groups, dtype=np.float32)
+		self.limited = np.zeros_like(output_map.scaled)
+		self.universe_scales = []  # (universe index, scale) for the universes scaled down in the latest frame
+
+		self.frames_limited = 0
+		self.max_group_amps = np.zeros(self.num_groups, dtype=np.float32)
+
+	def limit(self):
+		# call after OutputMap.encode. works from the unlimited scaled values, which are kept for every universe,
+		# and returns the universes whose bytes were rewritten so they get sent even if they weren't re-encoded
+		output_map = self.output_map
+		np.add.reduceat(output_map.scaled, self.universe_starts, out=self.universe_sums)
+		np.matmul(self.group_members, self.universe_sums, out=self.group_amps)
+		self.group_amps *= self.amps_per_channel_value
+		np.maximum(self.max_group_amps, self.group_amps, out=self.max_group_amps)
+
+		np.divide(self.group_budget_amps, np.maximum(self.group_amps, 1e-6), out=self.group_scales)
+		np.minimum(self.group_scales, 1, out=self.group_scales)
+
+		# groups over budget are scaled, and groups that were over budget last frame are restored to their unlimited values
+		rewritten_universes = []
+		self.universe_scales = []
+		for g in np.flatnonzero((self.group_scales < 1) | (self.last_group_scales < 1)):
+			scale = self.group_scales[g]
+			for u in self.group_universe_indexes[g]:
+				start, stop = output_map.universe_slices[u]
+				if scale < 1:
+					self.universe_scales.append((u, scale))
+					np.multiply(output_map.scaled[start:stop], scale, out=self.limited[start:stop])
+					np.copyto(output_map.channel_buffer[start:stop], self.limited[start:stop], casting='unsafe')
+				else:
+					np.copyto(output_map.channel_buffer[start:stop], output_map.scaled[start:stop], casting='unsafe')
+				rewritten_universes.append(u)
+
+		if self.group_scales.min() < 1:
+			self.frames_limited += 1
+		self.last_group_scales[:] = self.group_scales
+		return rewritten_universes
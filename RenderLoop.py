@@ -0,0 +1,55 @@
+import threading
+from time import monotonic
+
+import global_vars
+
+
+class RenderLoop:
+	# runs the tick function on one dedicated thread at a fixed frame rate
+	# frames are scheduled against a monotonic grid so slow ticks don't cause the cadence to drift
+	def __init__(self, logger, tick_function, target_fps=20):
+		self.logger = logger
+		self.tick_function = tick_function
+		self.set_target_fps(target_fps)
+
+		self.frame_count = 0
+		self.overrun_count = 0
+		self.skipped_frame_count = 0
+		self.max_overrun_secs = 0.0
+
+		self.stop_event = threading.Event()
+		self.thread = threading.Thread(target=self.run, name='render_loop', daemon=True)
+
+	def set_target_fps(self, target_fps):
+		self.target_fps = target_fps
+		self.frame_period = 1.0 / target_fps
+
+	def start(self):
+		self.thread.start()
+
+	def stop(self):
+		self.stop_event.set()
+		if self.thread.is_alive() and threading.current_thread() is not self.thread:
+			self.thread.join(timeout=1)
+
+	def run(self):
+		next_frame_time = monotonic()
+		while not self.stop_event.is_set() and not global_vars.STOP_THREADS:
+			try:
+				self.tick_function()
+			except Exception:
+				self.logger.error('Encountered exception in render loop tick. Capturing details and carrying on with the next frame', exc_info=True)
+			self.frame_count += 1
+
+			next_frame_time += self.frame_period
+			overrun = monotonic() - next_frame_time
+			if overrun > 0:
+				# the tick ran past the start of the next frame
+				# drop any frames that were missed completely and start the next one right away rather than bursting to catch up
+				self.overrun_count += 1
+				self.max_overrun_secs = max(self.max_overrun_secs, overrun)
+				skipped = int(overrun / self.frame_period)
+				self.skipped_frame_count += skipped
+				next_frame_time += skipped * self.frame_period
+			else:
+				self.stop_event.wait(-overrun)
@@ -0,0 +1,95 @@
+import argparse
+import logging
+import sys
+from time import perf_counter
+
+import numpy as np
+
+from FrameRecorder import FrameRecording
+from Layout import Layout
+from LightSender import LightSender, LAYOUT_FILE
+from OutputMap import OutputMap
+
+# replays a session captured by FrameRecorder through the output path as fast as possible
+# the recorded channel bytes are scattered back into frames through the layout, then either pushed through
+# LightSender.set_frame + flush on a non-live sender (the default) or through just OutputMap.encode (--encode-only)
+# usage: python Replay.py recording.bin [--encode-only] [--output null] [--layout layouts/30x10x5.json] [--repeat 1]
+
+
+def replay_encode_only(recording, output_map, repeat=1):
+	frame = OutputMap.make_frame(output_map.light_dimensions)
+	timings = []
+	bytes_produced = 0
+	for r in range(repeat):
+		for channels in recording.frames:
+			output_map.decode(channels, frame)
+			start = perf_counter()
+			output_map.encode(frame, 1.0)
+			payloads = [output_map.get_payload(u) for u in range(output_map.num_universes)]
+			timings.append(perf_counter() - start)
+			bytes_produced += sum(len(x) for x in payloads)
+
+	return timings, bytes_produced
+
+
+def replay_light_sender(recording, light_sender, repeat=1):
+	frame = OutputMap.make_frame(light_sender.light_dimensions)
+	light_sender.master_dimming = 1.0  # recordings are captured after dimming so replay them as is
+	timings = []
+	for r in range(repeat):
+		for channels in recording.frames:
+			light_sender.output_map.decode(channels, frame)
+			start = perf_counter()
+			light_sender.set_frame(frame)
+			light_sender.flush()
+			timings.append(perf_counter() - start)
+
+	return timings, light_sender.output.bytes_sent
+
+
+def summarize(logger, timings, bytes_produced, recording):
+	if not timings:
+		logger.info('Recording has no frames to replay')
+		return
+
+	timings_ms = np.array(timings) * 1000
+	total_secs = float(np.sum(timings)) or float('inf')
+	duration = recording.timestamps[-1] - recording.timestamps[0] if len(recording) > 1 else 0
+	logger.info(f'Replayed {len(timings)} frames ({duration:.1f} s of recorded time) in {total_secs:.3f} s of encode time')
+	logger.info(f'{len(timings) / total_secs:.0f} frames per second, encode p50 {np.percentile(timings_ms, 50):.3f} ms, p99 {np.percentile(timings_ms, 99):.3f} ms, max {np.max(timings_ms):.3f} ms')
+	logger.info(f'{bytes_produced} bytes produced ({bytes_produced / len(timings):.0f} per frame)')
+
+
+def main(argv):
+	parser = argparse.ArgumentParser(description='Replay a frame recording through the output path and report encode performance')
+	parser.add_argument('recording')
+	parser.add_argument('--layout', default=LAYOUT_FILE)
+	parser.add_argument('--output', default='null', help='output backend used by the light sender')
+	parser.add_argument('--encode-only', action='store_true', help='only time OutputMap.encode rather than the full LightSender flush')
+	parser.add_argument('--repeat', type=int, default=1)
+	args = parser.parse_args(argv)
+
+	logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+	logger = logging.getLogger()
+
+	recording = FrameRecording(args.recording)
+	logger.info(f'Loaded {len(recording)} frames of {recording.frame_size} channels from {args.recording}')
+
+	if args.encode_only:
+		output_map = Layout.load(args.layout, logger).output_map
+		if len(output_map.channel_buffer) != recording.frame_size:
+			raise ValueError(f'layout {args.layout} has {len(output_map.channel_buffer)} channels but the recording has {recording.frame_size}')
+		timings, bytes_produced = replay_encode_only(recording, output_map, args.repeat)
+	else:
+		light_sender = LightSender(logger, layout_file=args.layout, output_backend=args.output, is_live=False)
+		if len(light_sender.output_map.channel_buffer) != recording.frame_size:
+			raise ValueError(f'layout {args.layout} has {len(light_sender.output_map.channel_buffer)} channels but the recording has {recording.frame_size}')
+		timings, bytes_produced = replay_light_sender(recording, light_sender, args.repeat)
+		light_sender.output.stop()
+
+	summarize(logger, timings, bytes_produced, recording)
+	recording.close()
+
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
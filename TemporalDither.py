@@ -0,0 +1,30 @@
+import numpy as np
+
+
+class TemporalDither:
+	# replaces the truncation of the dimmed channel values with error diffusion over time
+	# every channel keeps the fraction that was dropped when it was quantized and adds it back the next frame,
+	# so a channel scaled to 10.4 goes out as 10 most frames and 11 in two frames out of five and averages out right.
+	# everything is done in place in buffers allocated here, so it adds no per frame allocations
+	def __init__(self, output_map):
+		self.output_map = output_map
+		self.target = np.zeros_like(output_map.scaled)
+		self.quantized = np.zeros_like(output_map.scaled)
+		self.error = np.zeros_like(output_map.scaled)
+
+	def apply(self, universe_scales=()):
+		# call after OutputMap.encode (and the power limiter) has run over every universe
+		# universe_scales lists (universe index, scale) for universes the power limiter scaled down this frame
+		output_map = self.output_map
+		np.copyto(self.target, output_map.scaled)
+		for u, scale in universe_scales:
+			start, stop = output_map.universe_slices[u]
+			self.target[start:stop] *= scale
+
+		self.target += self.error
+		np.floor(self.target, out=self.quantized)
+		np.subtract(self.target, self.quantized, out=self.error)
+		np.copyto(output_map.channel_buffer, self.quantized, casting='unsafe')
+
+	def reset(self):
+		self.error.fill(0)
@@ -1,16 +1,142 @@
-import matplotlib.pyplot as plt
+import argparse
+import logging
+import os
+import sys
+from datetime import datetime
+from time import monotonic, sleep
 
-# Create a figure and axis
-fig, ax = plt.subplots()
+import numpy as np
 
-for i in range(30):
-	for j in range(10):
-		circle = plt.Circle((i, j), 0.4, fill=False)
-		ax.add_patch(circle)
+from OutputMap import OutputMap
+from OutputBackends import DMX_CHANNELS_PER_UNIVERSE
 
+DISPLAY_FPS = 40
+STATS_WINDOW_SECS = 2
 
-# Set axis limits and show the plot
-ax.set_xlim(-1, 30)
-ax.set_ylim(-1, 10)
-plt.axis('equal')  # To ensure the aspect ratio is maintained
-plt.show()
+
+class VirtualDisplay:
+	# draws the frames a LightSender produces through its display (SharedFrameOutput) backend
+	# the display only ever reads the shared channel buffer so it can never slow the render loop down
+	# the D grids are drawn side by side, front grid on the left, with a one pixel gap between them
+	def __init__(self, output, output_map, gain=1.0, output_dir=None):
+		self.output = output
+		self.output_map = output_map
+		self.gain = gain
+		self.output_dir = output_dir
+		self.light_dimensions = L, H, D = output_map.light_dimensions
+
+		# where each frame channel lives in the shared num_universes x 512 buffer
+		display_index = np.zeros(len(output_map.gather_index), dtype=np.intp)
+		for u, (start, stop) in enumerate(output_map.universe_slices):
+			first_channel = u * DMX_CHANNELS_PER_UNIVERSE + len(output_map.universe_padding[u])
+			display_index[start:stop] = np.arange(first_channel, first_channel + stop - start)
+		self.display_index = display_index
+
+		self.snapshot = np.zeros_like(output.channels)
+		self.frame = OutputMap.make_frame(self.light_dimensions)
+		self.image = np.zeros((H, D * (L + 1) - 1, 3), dtype=np.uint8)
+
+		self.last_sequence = -1
+		self.frames_shown = 0
+		self.frames_received = 0
+		self.latencies = []
+		self.stats_start = monotonic()
+		self.stats_text = ''
+
+		if output_dir is not None:
+			import matplotlib
+			matplotlib.use('Agg')
+			os.makedirs(output_dir, exist_ok=True)
+		import matplotlib.pyplot as plt
+		self.plt = plt
+
+		self.fig, self.ax = plt.subplots(figsize=(max(6, D * (L + 1) / 8), max(2, H / 4)))
+		self.ax.set_axis_off()
+		self.im = self.ax.imshow(self.image, origin='lower', interpolation='nearest')
+		self.title = self.ax.set_title('')
+		if output_dir is None:
+			plt.show(block=False)
+
+	def read_frame(self):
+		# copy the shared buffer, giving up on this refresh if the sender was part way through a frame
+		sequence = self.output.sequence
+		if sequence % 2 == 1 or sequence == self.last_sequence:
+			return False
+		np.copyto(self.snapshot, self.output.channels)
+		if self.output.sequence != sequence:
+			return False
+
+		if self.last_sequence >= 0:
+			self.frames_received += (sequence - self.last_sequence) // 2
+		self.last_sequence = sequence
+		self.latencies.append(datetime.now().timestamp() - self.output.frame_timestamp)
+		self.frame.reshape(-1)[self.output_map.gather_index] = self.snapshot.reshape(-1)[self.display_index]
+		return True
+
+	def draw(self):
+		L, H, D = self.light_dimensions
+		for d in range(D):
+			self.image[:, d * (L + 1):d * (L + 1) + L] = self.frame[d]
+		if self.gain != 1.0:
+			self.im.set_data(np.clip(self.image * self.gain, 0, 255).astype(np.uint8))
+		else:
+			self.im.set_data(self.image)
+
+		now = monotonic()
+		if now - self.stats_start >= STATS_WINDOW_SECS:
+			elapsed = now - self.stats_start
+			latency_ms = 1000 * np.mean(self.latencies) if self.latencies else 0
+			self.stats_text = f'sender {self.frames_received / elapsed:.1f} fps, display {self.frames_shown / elapsed:.1f} fps, latency {latency_ms:.1f} ms'
+			self.frames_received = self.frames_shown = 0
+			self.latencies = []
+			self.stats_start = now
+		self.title.set_text(self.stats_text)
+
+		if self.output_dir is not None:
+			self.fig.savefig(os.path.join(self.output_dir, f'frame_{self.last_sequence // 2:06d}.png'))
+		else:
+			self.fig.canvas.draw_idle()
+			self.fig.canvas.flush_events()
+		self.frames_shown += 1
+
+	def run(self, display_fps=DISPLAY_FPS, duration_secs=None):
+		period = 1.0 / display_fps
+		start = next_refresh = monotonic()
+		while duration_secs is None or monotonic() - start < duration_secs:
+			if self.read_frame():
+				self.draw()
+			next_refresh += period
+			remaining = next_refresh - monotonic()
+			if remaining > 0:
+				sleep(remaining)
+			else:
+				next_refresh = monotonic()
+
+
+def main(argv):
+	from LightSender import LightSender, LAYOUT_FILE
+
+	parser = argparse.ArgumentParser(description='Run the light sender with a virtual display instead of real lights')
+	parser.add_argument('--layout', default=LAYOUT_FILE)
+	parser.add_argument('--output-dir', default=None, help='write frames as png files here instead of opening a window')
+	parser.add_argument('--duration', type=float, default=None, help='seconds to run for')
+	parser.add_argument('--fps', type=float, default=DISPLAY_FPS, help='display refresh rate')
+	parser.add_argument('--gain', type=float, default=1.0, help='brighten the display to make up for master dimming')
+	args = parser.parse_args(argv)
+
+	logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+	logger = logging.getLogger()
+
+	light_sender = LightSender(logger, layout_file=args.layout, output_backend='display')
+	light_sender.toggle_test_mode()  # keep the lights on regardless of the time of day
+	display = VirtualDisplay(light_sender.output, light_sender.output_map, gain=args.gain, output_dir=args.output_dir)
+	try:
+		display.run(display_fps=args.fps, duration_secs=args.duration)
+	except KeyboardInterrupt:
+		pass
+	finally:
+		light_sender.stop()
+
+
+if __name__ == '__main__':
+	main(sys.argv[1:])